@@ -1,15 +1,45 @@
 // admin.js
 let visitors = [];
+let nextCursor = null;
+let filterTimer = null;
+let newVisitorsWaiting = 0;
 
-async function loadVisitors() {
+// Build the /api/visitors query string from the search box and date filter
+function buildVisitorQuery(cursor) {
+  const params = new URLSearchParams();
+  const searchTerm = document.getElementById("searchInput").value.trim();
+  const dateFilter = document.getElementById("dateFilter").value;
+  if (searchTerm) {
+    params.set("q", searchTerm);
+  }
+  const now = new Date();
+  if (dateFilter === "today") {
+    params.set("from", new Date(now.getFullYear(), now.getMonth(), now.getDate()).toISOString());
+  } else if (dateFilter === "thisweek") {
+    params.set("from", new Date(now.getFullYear(), now.getMonth(), now.getDate() - 7).toISOString());
+  }
+  if (cursor) {
+    params.set("cursor", cursor);
+  }
+  return params.toString();
+}
+
+// Load the first page, or the next one when append is true
+async function loadVisitors(append = false) {
   try {
-    const response = await fetch("/api/visitors");
+    const response = await fetch("/api/visitors?" + buildVisitorQuery(append ? nextCursor : null));
     if (!response.ok) {
       alert("Error loading visitors. Are you logged in?");
       return;
     }
-    visitors = await response.json();
+    const page = await response.json();
+    visitors = append ? visitors.concat(page.visitors) : page.visitors;
+    if (!append) {
+      setNewVisitorsWaiting(0);
+    }
+    nextCursor = page.next_cursor;
     displayVisitors(visitors);
+    document.getElementById("loadMoreBtn").style.display = nextCursor ? "inline-block" : "none";
   } catch (error) {
     console.error("Failed to load visitors:", error);
     alert("Error loading visitors");
@@ -52,8 +82,9 @@ function displayVisitors(list) {
     const photoCell = document.createElement("td");
     if (visitor.photo_download) {
       const img = document.createElement("img");
-      img.src = visitor.photo_download;
+      img.src = visitor.photo_thumb || visitor.photo_download;
       img.alt = "Visitor Photo";
+      img.loading = "lazy";
       photoCell.appendChild(img);
     } else {
       photoCell.textContent = "No photo";
@@ -79,11 +110,8 @@ function displayVisitors(list) {
 }
 document.addEventListener("DOMContentLoaded", () => {
 
-    // Function to display visitors in the table
-    function displayVisitors(list) {
-      const tbody = document.getElementById("visitorTbody");
-      tbody.innerHTML = "";
-      list.forEach((visitor) => {
+    // Build the table row for one visitor
+    function createVisitorRow(visitor) {
         const row = document.createElement("tr");
   
         // Name cell with modal trigger
@@ -115,8 +143,9 @@ document.addEventListener("DOMContentLoaded", () => {
         const photoCell = document.createElement("td");
         if (visitor.photo_download) {
           const img = document.createElement("img");
-          img.src = visitor.photo_download;
+          img.src = visitor.photo_thumb || visitor.photo_download;
           img.alt = "Visitor Photo";
+          img.loading = "lazy";
           photoCell.appendChild(img);
         } else {
           photoCell.textContent = "No photo";
@@ -136,9 +165,20 @@ document.addEventListener("DOMContentLoaded", () => {
           badgeCell.textContent = "No badge";
         }
         row.appendChild(badgeCell);
-  
-        tbody.appendChild(row);
-      });
+        return row;
+    }
+
+    // Function to display visitors in the table
+    function displayVisitors(list) {
+      const tbody = document.getElementById("visitorTbody");
+      tbody.innerHTML = "";
+      list.forEach((visitor) => tbody.appendChild(createVisitorRow(visitor)));
+    }
+
+    // Add newly registered visitors at the top of the table (newest first)
+    function prependVisitors(list) {
+      const tbody = document.getElementById("visitorTbody");
+      list.forEach((visitor) => tbody.insertBefore(createVisitorRow(visitor), tbody.firstChild));
     }
   
     // Function to open the visitor details modal
@@ -175,34 +215,19 @@ document.addEventListener("DOMContentLoaded", () => {
   
     // Optionally, expose displayVisitors globally if you call it from elsewhere
     window.displayVisitors = displayVisitors;
+    window.prependVisitors = prependVisitors;
   });
   
+// Filtering happens on the server; wait until the user stops typing
 function filterVisitors() {
-  const searchTerm = document.getElementById("searchInput").value.toLowerCase();
-  const dateFilter = document.getElementById("dateFilter").value;
-  const filtered = visitors.filter((v) => {
-    const matchSearch =
-      v.full_name.toLowerCase().includes(searchTerm) ||
-      v.purpose.toLowerCase().includes(searchTerm);
-    let matchDate = true;
-    if (dateFilter === "today") {
-      const dt = new Date(v.created_at);
-      const now = new Date();
-      matchDate = dt.toDateString() === now.toDateString();
-    } else if (dateFilter === "thisweek") {
-      const dt = new Date(v.created_at);
-      const now = new Date();
-      const weekAgo = new Date(now.getFullYear(), now.getMonth(), now.getDate() - 7);
-      matchDate = dt >= weekAgo && dt <= now;
-    }
-    return matchSearch && matchDate;
-  });
-  displayVisitors(filtered);
+  clearTimeout(filterTimer);
+  filterTimer = setTimeout(() => loadVisitors(), 300);
 }
 
 function setupFilters() {
   document.getElementById("searchInput").addEventListener("input", filterVisitors);
   document.getElementById("dateFilter").addEventListener("change", filterVisitors);
+  document.getElementById("loadMoreBtn").addEventListener("click", () => loadVisitors(true));
 }
 
 function setupLogout() {
@@ -213,8 +238,37 @@ function setupLogout() {
   });
 }
 
-window.addEventListener("DOMContentLoaded", () => {
-  loadVisitors();
+// Newly registered visitors arrive over Server-Sent Events and are added to
+// the table one row at a time instead of reloading the whole list
+function startVisitorStream() {
+  const lastId = visitors.reduce((max, visitor) => Math.max(max, visitor.id), 0);
+  const stream = new EventSource("/api/visitors/stream" + (lastId ? "?after=" + lastId : ""));
+  stream.addEventListener("visitor", (event) => {
+    const visitor = JSON.parse(event.data);
+    if (visitors.some((shown) => shown.id === visitor.id)) {
+      return;
+    }
+    if (document.getElementById("searchInput").value.trim()) {
+      // Whether it matches the search is up to the server; offer a reload
+      setNewVisitorsWaiting(newVisitorsWaiting + 1);
+      return;
+    }
+    visitors.unshift(visitor);
+    window.prependVisitors([visitor]);
+  });
+}
+
+function setNewVisitorsWaiting(count) {
+  newVisitorsWaiting = count;
+  const notice = document.getElementById("newVisitorsBtn");
+  notice.textContent = count === 1 ? "1 new visitor" : count + " new visitors";
+  notice.style.display = count ? "inline-block" : "none";
+}
+
+window.addEventListener("DOMContentLoaded", async () => {
   setupFilters();
   setupLogout();
+  document.getElementById("newVisitorsBtn").addEventListener("click", () => loadVisitors());
+  await loadVisitors();
+  startVisitorStream();
 });
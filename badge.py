@@ -0,0 +1,259 @@
+"""
+Badge layout shared by the PDF badge and the printed label.
+
+A badge is composed once as a single image (school logo and background are
+cached, only the visitor's text and photo are drawn per badge) and that same
+image is emitted both as the 62mm x 62mm PDF and as Brother QL raster
+instructions, so the two can't drift apart.
+
+The font and the school logo never change between visitors, so they are
+loaded once and kept in memory. Every lookup checks the files' mtimes and
+reloads them if they were replaced on disk.
+"""
+import io
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+# === PIL and patch for newer Pillow versions (ANTIALIAS -> Resampling) ===
+from PIL import Image, ImageDraw, ImageFont
+if not hasattr(Image, 'ANTIALIAS'):
+    from PIL import Image as PIL_Image
+    Image.ANTIALIAS = PIL_Image.Resampling.LANCZOS
+
+from brother_ql.conversion import convert
+from brother_ql.raster import BrotherQLRaster
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_PATH = os.path.join(BASE_DIR, "BebasNeue-Regular.ttf")
+LOGO_PATH = os.path.join(BASE_DIR, "logo.png")
+
+# A child of the app's logger, so its lines go wherever the app's do
+logger = logging.getLogger("kasvisitor.badge")
+
+# 62mm tape has 696 printable dots at 300 dpi; composing at exactly that
+# width means brother_ql doesn't have to resize the badge again.
+BADGE_SIZE_PX = 696
+PDF_PAGE_SIZE = 62 * mm
+
+PRINTER_MODEL = 'QL-800'
+LABEL_TAPE = '62'  # 62 mm continuous tape
+
+# Bump when the layout or the raster settings change: printed labels are
+# cached (kasvisitor/labels.py) under a key that includes it.
+BADGE_LAYOUT_VERSION = 1
+
+# Layout, in pixels of the square badge
+MARGIN = 32
+NAME_FONT_SIZE = 80
+MIN_NAME_FONT_SIZE = 40
+INFO_FONT_SIZE = 46
+INFO_LINE_SPACING = 8
+IMAGE_AREA_TOP = 330
+IMAGE_AREA_WIDTH = (BADGE_SIZE_PX - 2 * MARGIN) // 2
+IMAGE_AREA_HEIGHT = BADGE_SIZE_PX - MARGIN - IMAGE_AREA_TOP
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def layout_version():
+    """BADGE_LAYOUT_VERSION and the current font and logo files, as one string."""
+    return f"{BADGE_LAYOUT_VERSION}:{_mtime(FONT_PATH)}:{_mtime(LOGO_PATH)}"
+
+
+def _fit(image, box):
+    """Scale a copy of image to fit inside box, keeping its aspect ratio."""
+    image = image.copy()
+    image.thumbnail(box, Image.LANCZOS)
+    return image
+
+
+class BadgeAssets:
+    """
+    Lazily loaded, mtime-checked cache of the static badge assets.
+    """
+
+    def __init__(self, font_path=FONT_PATH, logo_path=LOGO_PATH):
+        self.font_path = font_path
+        self.logo_path = logo_path
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._fonts = {}
+        self._background = None
+
+    def invalidate(self):
+        """Forget everything; the next lookup reloads from disk."""
+        with self._lock:
+            self._mtimes = None
+
+    def _ensure_loaded(self):
+        mtimes = (_mtime(self.font_path), _mtime(self.logo_path))
+        if mtimes == self._mtimes:
+            return
+        with self._lock:
+            if mtimes == self._mtimes:
+                return
+            self._load()
+            self._mtimes = mtimes
+
+    def _load(self):
+        self._fonts = {}
+
+        # White badge with the logo already in the bottom-left image box
+        background = Image.new('RGB', (BADGE_SIZE_PX, BADGE_SIZE_PX), "white")
+        try:
+            logo = Image.open(self.logo_path).convert("RGBA")
+            logo = _fit(logo, (IMAGE_AREA_WIDTH, IMAGE_AREA_HEIGHT))
+            x = MARGIN + (IMAGE_AREA_WIDTH - logo.width) // 2
+            y = IMAGE_AREA_TOP + (IMAGE_AREA_HEIGHT - logo.height) // 2
+            background.paste(logo, (x, y), logo)
+        except Exception as e:
+            logger.error("School logo %s could not be loaded, badges have none: %s", self.logo_path, e)
+        self._background = background
+
+    def font(self, size):
+        """Badge font at the given pixel size, falling back to PIL's default."""
+        self._ensure_loaded()
+        font = self._fonts.get(size)
+        if font is None:
+            try:
+                font = ImageFont.truetype(self.font_path, size)
+            except Exception:
+                font = ImageFont.load_default()
+            self._fonts[size] = font
+        return font
+
+    def background(self):
+        """A fresh copy of the static badge layer to draw one visitor on."""
+        self._ensure_loaded()
+        return self._background.copy()
+
+
+assets = BadgeAssets()
+
+
+class Badge:
+    """
+    A composed badge image and the two ways it leaves the system.
+    """
+
+    def __init__(self, image, photo_failed=False):
+        self.image = image
+        # A photo was given but couldn't be decoded; the photo box is empty
+        self.photo_failed = photo_failed
+
+    def write_pdf(self, pdf_file):
+        """
+        Write the badge as a 62mm x 62mm PDF to a path or binary file object.
+        The image is embedded as JPEG so ReportLab can pass it through as-is.
+        """
+        jpeg = io.BytesIO()
+        self.image.save(jpeg, "JPEG", quality=92)
+        jpeg.seek(0)
+
+        c = canvas.Canvas(pdf_file, pagesize=(PDF_PAGE_SIZE, PDF_PAGE_SIZE))
+        c.drawImage(ImageReader(jpeg), 0, 0, width=PDF_PAGE_SIZE, height=PDF_PAGE_SIZE)
+        c.showPage()
+        c.save()
+
+    def raster_instructions(self, copies=1, model=PRINTER_MODEL, label=LABEL_TAPE):
+        """Brother QL raster instructions for printing this badge."""
+        return raster_instructions([self] * copies, model, label)
+
+
+def raster_instructions(badges, model=PRINTER_MODEL, label=LABEL_TAPE):
+    """
+    Brother QL raster instructions for a run of labels, one per entry in
+    badges, cut between labels. Sent together, they print in a single
+    printer session; list a badge several times for several copies.
+    """
+    qlr = BrotherQLRaster(model)
+    qlr.exception_on_warning = True
+
+    # brother_ql 0.9's convert() only accepts images by filename
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for badge in badges:
+            if id(badge) not in paths:
+                path = os.path.join(tmp, f"{len(paths)}.png")
+                badge.image.save(path, "PNG", compress_level=1)
+                paths[id(badge)] = path
+        return convert(
+            qlr=qlr,
+            images=[paths[id(badge)] for badge in badges],
+            label=label,
+            red=True,
+            threshold=70.0,
+            dither=False,
+            compress=False,
+            dpi_600=False,
+            hq=False,
+            cut=True
+        )
+
+
+def compose_badge(first_name, last_name, purpose, finding, photo, visit_date=None):
+    """
+    Compose a badge:
+      1. Visitor's full name (top center, shrunk to fit)
+      2. Purpose of visit, date of visit (YYYY-MM-DD), who they are meeting
+      3. School logo (bottom left)
+      4. Visitor's photo (bottom right)
+    'photo' is a path or an already opened PIL image; it is decoded once here.
+    With photo None, or one that can't be decoded (logged, and flagged as
+    Badge.photo_failed), the photo box is left empty.
+    """
+    image = assets.background()
+    draw = ImageDraw.Draw(image)
+    center_x = BADGE_SIZE_PX // 2
+    max_text_width = BADGE_SIZE_PX - 2 * MARGIN
+
+    # 1. Visitor's full name at the top (centered)
+    full_name = f"{first_name} {last_name}"
+    size = NAME_FONT_SIZE
+    font = assets.font(size)
+    while size > MIN_NAME_FONT_SIZE and draw.textlength(full_name, font=font) > max_text_width:
+        size -= 4
+        font = assets.font(size)
+    draw.text((center_x, MARGIN), full_name, fill='black', font=font, anchor='ma')
+    y = MARGIN + NAME_FONT_SIZE + 16
+
+    # 2. Purpose, Date, Meeting
+    font = assets.font(INFO_FONT_SIZE)
+    visit_date_str = (visit_date or datetime.now()).strftime("%Y-%m-%d")
+    info_lines = [
+        f"Purpose: {purpose}",
+        f"Date: {visit_date_str}",
+        f"Meeting: {finding}"
+    ]
+    for line in info_lines:
+        draw.text((center_x, y), line, fill='black', font=font, anchor='ma')
+        y += INFO_FONT_SIZE + INFO_LINE_SPACING
+
+    # 3. Bottom-right: Visitor photo (the logo is part of the background)
+    if photo is None:
+        return Badge(image)
+    try:
+        if not isinstance(photo, Image.Image):
+            photo = Image.open(photo)
+        photo.draft('RGB', (IMAGE_AREA_WIDTH, IMAGE_AREA_HEIGHT))
+        photo = photo.convert('RGB')
+        photo.thumbnail((IMAGE_AREA_WIDTH, IMAGE_AREA_HEIGHT), Image.LANCZOS)
+        x = MARGIN + IMAGE_AREA_WIDTH + (IMAGE_AREA_WIDTH - photo.width) // 2
+        y = IMAGE_AREA_TOP + (IMAGE_AREA_HEIGHT - photo.height) // 2
+        image.paste(photo, (x, y))
+    except Exception as e:
+        logger.warning("Visitor photo could not be decoded, badge composed without it: %s", e)
+        return Badge(image, photo_failed=True)
+
+    return Badge(image)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Badges/sec for composing a badge and emitting both the PDF and the
+Brother QL raster instructions from it.
+
+"cold" reloads the font and logo for every badge (what the code did before
+the asset cache), "warm" reuses the cached assets.
+
+    python benchmarks/bench_badges.py [-n 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from badge import assets, compose_badge
+
+
+def make_photo(directory):
+    path = os.path.join(directory, "photo.png")
+    # Smooth gradients compress like a webcam frame; noise would not
+    Image.merge("RGB", [Image.linear_gradient("L").resize((640, 480)),
+                        Image.radial_gradient("L").resize((640, 480)),
+                        Image.linear_gradient("L").rotate(90).resize((640, 480))]).save(path)
+    return path
+
+
+def run(n, photo_path, out_dir, cold):
+    start = time.perf_counter()
+    for i in range(n):
+        if cold:
+            assets.invalidate()
+        badge = compose_badge("Jane", "Doe", "Meeting", "Mr. Lee", photo_path)
+        badge.write_pdf(os.path.join(out_dir, f"badge_{i}.pdf"))
+        badge.raster_instructions()
+    return n / (time.perf_counter() - start)
+
+
+def asset_setup_ms(n, cold):
+    """Time spent only on getting the font/logo/background ready per badge."""
+    start = time.perf_counter()
+    for _ in range(n):
+        if cold:
+            assets.invalidate()
+        assets.font(80)
+        assets.background()
+    return (time.perf_counter() - start) * 1000 / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", type=int, default=50, help="badges per run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        photo_path = make_photo(tmp)
+        run(3, photo_path, tmp, cold=False)  # warm up imports
+        cold = run(args.n, photo_path, tmp, cold=True)
+        warm = run(args.n, photo_path, tmp, cold=False)
+
+    print(f"asset setup : {asset_setup_ms(args.n, True):8.2f} ms/badge cold, "
+          f"{asset_setup_ms(args.n, False):.3f} ms/badge cached")
+    print(f"cold assets : {cold:8.1f} badges/sec  ({1000 / cold:.1f} ms/badge)")
+    print(f"cached      : {warm:8.1f} badges/sec  ({1000 / warm:.1f} ms/badge, {warm / cold:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
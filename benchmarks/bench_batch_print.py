@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Labels/min through the print worker, one printer session per label versus
+batched runs, against a fake printer backend.
+
+The simulated printer sleeps for a fixed session cost (USB open, printer
+initialisation, status handshake) plus the transfer time of the raster
+data. The printer's own feed and cut time isn't modelled, so the numbers
+are an upper bound on what the host side can deliver.
+
+    python benchmarks/bench_batch_print.py [-n 40] [--session-ms 600] [--usb-kbps 1000]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+
+from kasvisitor import PrintJob, Visitor, create_app, db
+from kasvisitor import printing
+from kasvisitor.printers import PrinterRegistry, SimulatedPrinter
+
+
+def queue_jobs(visitor_ids, copies):
+    jobs = [PrintJob(visitor_id=visitor_id, copies=copies) for visitor_id in visitor_ids]
+    db.session.add_all(jobs)
+    db.session.commit()
+
+
+def drain(printer):
+    """Run the worker until the queue is empty; returns (labels/min, sessions)."""
+    sessions = printer.sessions
+    labels = sum(job.copies for job in PrintJob.query.filter_by(status='queued'))
+    start = time.perf_counter()
+    while printing.process_print_jobs():
+        pass
+    elapsed = time.perf_counter() - start
+    return labels / elapsed * 60, printer.sessions - sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", type=int, default=40, help="visitors in the group")
+    parser.add_argument("--session-ms", type=float, default=600, help="fake per-session setup cost")
+    parser.add_argument("--usb-kbps", type=float, default=1000, help="fake transfer rate, kB/s")
+    args = parser.parse_args()
+
+    printer = SimulatedPrinter("bench", session_ms=args.session_ms, usb_kbps=args.usb_kbps)
+    logging.getLogger("kasvisitor").setLevel(logging.WARNING)  # keep the per-run log line out of the table
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["STORAGE_ROOT"] = tmp
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'visitors.db')}"})
+        app.extensions["printers"] = PrinterRegistry([printer])
+        with app.app_context():
+            photo = Image.merge("RGB", [Image.linear_gradient("L").resize((640, 480)),
+                                        Image.radial_gradient("L").resize((640, 480)),
+                                        Image.linear_gradient("L").rotate(90).resize((640, 480))])
+            photo_path = os.path.join(tmp, "photo.jpg")
+            photo.save(photo_path)
+            with open(photo_path, "rb") as f:
+                photo_key = app.extensions["storage"].put("photos", f.read(), ".jpg")
+            visitors = [Visitor(first_name="Student", last_name=f"No. {i}", email="trip@example.com",
+                                phone=f"09{i:08d}", purpose="Event", finding="Ms. Wang",
+                                photo_path=photo_key, pdf_path="")
+                        for i in range(args.n)]
+            db.session.add_all(visitors)
+            db.session.commit()
+            ids = [v.id for v in visitors]
+
+            print(f"{args.n} visitors, fake session {args.session_ms:.0f} ms, {args.usb_kbps:.0f} kB/s")
+            print(f"{'mode':<24} {'labels/min':>11} {'sessions':>9}")
+            batch_max = printing.PRINT_BATCH_MAX_LABELS
+            for name, batch_labels, visitor_ids, copies in (
+                    ("one label per session", 1, ids, 1),
+                    ("batched group", batch_max, ids, 1),
+                    (f"1 visitor x {args.n} copies", batch_max, ids[:1], args.n)):
+                printing.PRINT_BATCH_MAX_LABELS = batch_labels
+                queue_jobs(visitor_ids, copies)
+                rate, sessions = drain(printer)
+                print(f"{name:<24} {rate:11.1f} {sessions:9d}")
+
+
+if __name__ == '__main__':
+    main()
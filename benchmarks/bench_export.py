@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+/api/visitors/export memory use and throughput as the visitor table grows.
+
+Fills a temporary SQLite database with synthetic visitors and streams the
+whole table through each export format, recording the Python heap peak
+(tracemalloc) and the time taken. "jsonify" is the old way of getting the
+log out: every row as a dict in one JSON response.
+
+    python benchmarks/bench_export.py [--sizes 10000 100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import jsonify
+
+from bench_visitors_api import add_rows
+from kasvisitor import Visitor, create_app
+from kasvisitor.admin import visitor_to_dict
+from kasvisitor.export import parquet_available
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20, elapsed, size / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    formats = ["csv", "ndjson"] + (["parquet"] if parquet_available() else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'visitors.db')}",
+                          "REQUEST_LOG": False},
+                         role="admin")
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['logged_in'] = True
+
+        def export(fmt):
+            response = client.get(f"/api/visitors/export?format={fmt}", buffered=False)
+            size = sum(len(chunk) for chunk in response.response)
+            response.close()
+            return size
+
+        def old_jsonify():
+            with app.test_request_context():
+                return len(jsonify([visitor_to_dict(v) for v in Visitor.query.all()]).get_data())
+
+        print(f"{'rows':>8} {'format':>8} {'peak MB':>8} {'seconds':>8} {'rows/s':>9} {'output MB':>10}")
+        total = 0
+        for size in sorted(args.sizes):
+            add_rows(app, total, size - total)
+            total = size
+            for name, fn in [(fmt, lambda fmt=fmt: export(fmt)) for fmt in formats] + [("jsonify", old_jsonify)]:
+                peak, elapsed, output = measure(fn)
+                print(f"{size:>8} {name:>8} {peak:8.1f} {elapsed:8.2f} {size / elapsed:9.0f} {output:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
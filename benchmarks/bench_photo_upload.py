@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+/submit with the photo as base64-in-JSON versus a multipart file part.
+
+Both requests carry the same PNG (what canvas.toDataURL() produces). Reports
+bytes on the wire, median latency and peak Python heap allocation
+(tracemalloc) while the server handles the request.
+
+    python benchmarks/bench_photo_upload.py [-n 20] [--width 1280 --height 720]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+from werkzeug.test import EnvironBuilder
+
+FIELDS = {
+    "firstName": "Jane", "lastName": "Doe", "email": "jane@example.com",
+    "phone": "0912345678", "purpose": "Meeting", "finding": "Mr. Lee",
+}
+
+
+def make_png(width, height):
+    # Noise on top of gradients, so the PNG is about as large as a webcam frame
+    base = Image.merge("RGB", [Image.linear_gradient("L").resize((width, height)),
+                               Image.radial_gradient("L").resize((width, height)),
+                               Image.effect_noise((width, height), 24)])
+    out = io.BytesIO()
+    base.save(out, "PNG")
+    return out.getvalue()
+
+
+def json_environ(png):
+    payload = dict(FIELDS, photo="data:image/png;base64," + base64.b64encode(png).decode())
+    body = json.dumps(payload).encode()
+    return EnvironBuilder(path="/submit", method="POST", data=body,
+                          content_type="application/json").get_environ(), len(body)
+
+
+def multipart_environ(png):
+    builder = EnvironBuilder(path="/submit", method="POST",
+                             data=dict(FIELDS, photo=(io.BytesIO(png), "photo.png", "image/png")))
+    environ = builder.get_environ()
+    return environ, int(environ["CONTENT_LENGTH"])
+
+
+def run(app, make_environ, png, n):
+    latencies, peaks = [], []
+    for _ in range(n):
+        environ, size = make_environ(png)
+        tracemalloc.start()
+        start = time.perf_counter()
+        body = b"".join(app.wsgi_app(environ, lambda status, headers: None))
+        latencies.append((time.perf_counter() - start) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert b'"success": true' in body or b'"success":true' in body, body
+    return size, statistics.median(latencies), max(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", type=int, default=20)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # photos/ and pdfs/ are created relative to the cwd
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'visitors.db')}"
+        import app2
+
+        png = make_png(args.width, args.height)
+        print(f"photo: {args.width}x{args.height} PNG, {len(png) / 1024:.0f} KiB")
+        print(f"{'path':<10} {'request':>12} {'median':>10} {'peak heap':>11}")
+        run(app2.app, multipart_environ, png, 2)  # warm up
+        for name, make_environ in (("json", json_environ), ("multipart", multipart_environ)):
+            size, latency, peak = run(app2.app, make_environ, png, args.n)
+            print(f"{name:<10} {size / 1024:9.0f} KiB {latency:7.1f} ms {peak / 1024 / 1024:7.2f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Guest list import time: /api/registrations/import against one ORM insert
+and commit per visitor (what registering them through /submit costs in the
+database alone), plus the background badge pre-render rate.
+
+    python benchmarks/bench_registration_import.py [--rows 10000] [--prerender 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import kasvisitor.admin
+from kasvisitor import Registration, create_app, db
+from kasvisitor.registrations import REGISTRATION_FIELDS, prerender_badges
+
+
+def guest_list(rows):
+    today = date.today().isoformat()
+    lines = [",".join(REGISTRATION_FIELDS)]
+    for i in range(rows):
+        lines.append(f"Guest{i},Family{i % 500},guest{i}@example.com,09{i:08d},Open day,Teacher {i % 97},{today}")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--prerender", type=int, default=200, help="badges to pre-render for the rate")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["STORAGE_ROOT"] = tmp
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'visitors.db')}",
+                          "REQUEST_LOG": False},
+                         role="admin")
+        body = guest_list(args.rows)
+
+        with app.app_context():
+            start = time.perf_counter()
+            for i in range(args.rows):
+                db.session.add(Registration(first_name=f"Guest{i}", last_name="Family", phone=f"09{i:08d}"))
+                db.session.commit()
+            per_row = time.perf_counter() - start
+            Registration.query.delete()
+            db.session.commit()
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['logged_in'] = True
+        # Time the import alone; the pre-render is measured separately below
+        kasvisitor.admin.start_badge_prerender = lambda app: None
+        start = time.perf_counter()
+        response = client.post("/api/registrations/import", data=body, content_type="text/csv")
+        imported = time.perf_counter() - start
+        assert response.get_json()["imported"] == args.rows, response.get_json()
+
+        with app.app_context():
+            start = time.perf_counter()
+            rendered = 0
+            while rendered < args.prerender:
+                rendered += prerender_badges()
+            prerender = time.perf_counter() - start
+
+        print(f"{args.rows} guests")
+        print(f"  commit per row      {per_row:8.2f} s  {args.rows / per_row:8.0f} rows/s")
+        print(f"  import endpoint     {imported:8.2f} s  {args.rows / imported:8.0f} rows/s")
+        print(f"  badge pre-render    {prerender / rendered * 1000:8.1f} ms/badge "
+              f"({args.rows * prerender / rendered / 60:.1f} min for all, in the background)")
+
+
+if __name__ == '__main__':
+    main()
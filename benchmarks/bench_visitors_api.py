@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+/api/visitors response time as the visitor table grows.
+
+Fills a temporary SQLite database with synthetic visitors and times the
+first page, a page deep in the keyset pagination, a filtered search and a
+ranked full-text lookup (/api/visitors/search) at each size. "full list"
+is the old unpaginated query plus serialization, for comparison.
+
+    python benchmarks/bench_visitors_api.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kasvisitor import Visitor, create_app, db
+from kasvisitor.admin import visitor_to_dict
+
+PURPOSES = ["Meeting", "Tour", "Event", "Delivery", "Other"]
+FIRST_NAMES = ["Daniel", "Mei", "James", "Yu-Ting", "Sarah", "Wei", "Emily", "Chen"]
+LAST_NAMES = ["Chen", "Lin", "Wang", "Smith", "Huang", "Lee", "Tsai", "Brown", "Kuo", "Hsu",
+              "Garcia", "Wu", "Chang", "Miller", "Liu", "Yang", "Kim", "Park", "Lo", "Cheng"]
+
+
+def add_rows(app, start, count):
+    base = datetime(2024, 1, 1)
+    rows = []
+    for i in range(start, start + count):
+        rows.append({
+            "first_name": random.choice(FIRST_NAMES),
+            "last_name": random.choice(LAST_NAMES),
+            "email": f"visitor{i}@example.com",
+            "phone": f"09{i:08d}",
+            "purpose": random.choice(PURPOSES),
+            "finding": f"Teacher {i % 97}",
+            "photo_path": f"photos/visitor_{i}.png",
+            "pdf_path": f"pdfs/visitor_{i}.pdf",
+            "created_at": base + timedelta(minutes=i),
+        })
+    with app.app_context():
+        db.session.execute(Visitor.__table__.insert(), rows)
+        db.session.commit()
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--skip-full", action="store_true", help="don't time the old full list")
+    args = parser.parse_args()
+    random.seed(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'visitors.db')}",
+                          "REQUEST_LOG": False},
+                         role="admin")
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['logged_in'] = True
+
+        def deep_page():
+            cursor = None
+            for _ in range(10):
+                url = "/api/visitors" + (f"?cursor={cursor}" if cursor else "")
+                cursor = client.get(url).get_json()["next_cursor"]
+
+        def full_list():
+            with app.app_context():
+                rows = Visitor.query.order_by(Visitor.created_at.desc()).all()
+                [visitor_to_dict(v) for v in rows]
+
+        print(f"{'rows':>8} {'first page':>11} {'10 pages':>9} {'filtered':>9} {'fts search':>11} "
+              f"{'full list':>10}  (ms)")
+        total = 0
+        for size in sorted(args.sizes):
+            add_rows(app, total, size - total)
+            total = size
+            first = timed(lambda: client.get("/api/visitors"))
+            deep = timed(deep_page, repeat=3)
+            filtered = timed(lambda: client.get("/api/visitors?q=smith&purpose=Tour&from=2024-01-02"))
+            search = timed(lambda: client.get(f"/api/visitors/search?q=chen 09{size // 2:08d}"))
+            full = "-" if args.skip_full else f"{timed(full_list, repeat=1):10.1f}"
+            print(f"{size:>8} {first:11.2f} {deep:9.2f} {filtered:9.2f} {search:11.2f} {full:>10}")
+
+
+if __name__ == '__main__':
+    main()
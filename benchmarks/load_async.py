@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Registrations one kiosk process keeps in flight: the WSGI app with a fixed
+number of threads (like gunicorn --threads) against the ASGI app (asgi.py).
+
+Both apps are driven in-process, so the numbers are about how each holds
+on to a request, not about server overhead: --kiosks simulated kiosks each
+post --per-kiosk registrations back to back, and every upload trickles in
+over --upload-ms, as a photo does over the kiosks' Wi-Fi. A WSGI thread is
+held while the body arrives; the ASGI app only waits on the event loop.
+Reports p50/p95 latency (including time queued for a thread) and throughput.
+
+    python benchmarks/load_async.py [--kiosks 8 32 64] [--threads 8] [--upload-ms 500]
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+from load_submit import FIELDS, make_jpeg, percentile
+
+UPLOAD_CHUNKS = 10
+
+
+def make_body(seed):
+    return encode_multipart({**FIELDS, "photo": FileStorage(io.BytesIO(make_jpeg(seed)), "photo.jpg")})
+
+
+def app_config(tmp, name, workers):
+    return {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, name)}.db",
+            "RENDER_WORKERS": workers, "REQUEST_LOG": False}
+
+
+def run_sync(tmp, kiosks, per_kiosk, threads, upload, workers):
+    from kasvisitor import create_app
+
+    app = create_app(app_config(tmp, f"sync-{kiosks}", workers), role="kiosk")
+    pool = ThreadPoolExecutor(threads)
+    latencies, statuses = [], []
+
+    def handle(boundary, body):
+        # The worker thread reads the body as it arrives
+        time.sleep(upload)
+        response = app.test_client().post("/submit", data=body,
+                                          content_type=f"multipart/form-data; boundary={boundary}")
+        return response.status_code
+
+    def kiosk(seed):
+        boundary, body = make_body(seed)
+        for _ in range(per_kiosk):
+            start = time.perf_counter()
+            statuses.append(pool.submit(handle, boundary, body).result())
+            latencies.append(time.perf_counter() - start)
+
+    clients = [threading.Thread(target=kiosk, args=(i,)) for i in range(kiosks)]
+    start = time.perf_counter()
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    if app.extensions.get("render_pool") is not None:
+        app.extensions["render_pool"].shutdown()
+    return latencies, statuses, elapsed
+
+
+def run_async(tmp, kiosks, per_kiosk, upload, workers):
+    from kasvisitor.asgi import create_asgi_app
+
+    app = create_asgi_app(app_config(tmp, f"async-{kiosks}", workers))
+    latencies, statuses = [], []
+
+    async def post(boundary, body):
+        size = len(body)
+        chunks = [body[i * size // UPLOAD_CHUNKS:(i + 1) * size // UPLOAD_CHUNKS] for i in range(UPLOAD_CHUNKS)]
+        response = {}
+
+        async def receive():
+            await asyncio.sleep(upload / UPLOAD_CHUNKS)
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+
+        scope = {"type": "http", "method": "POST", "path": "/submit", "query_string": b"",
+                 "http_version": "1.1", "server": ("127.0.0.1", 5000), "client": ("127.0.0.1", 0),
+                 "headers": [(b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+                             (b"content-length", str(size).encode())]}
+        await app(scope, receive, send)
+        return response["status"]
+
+    async def kiosk(seed):
+        boundary, body = make_body(seed)
+        for _ in range(per_kiosk):
+            start = time.perf_counter()
+            statuses.append(await post(boundary, body))
+            latencies.append(time.perf_counter() - start)
+
+    async def main():
+        await asyncio.gather(*(kiosk(i) for i in range(kiosks)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    app.shutdown()
+    return latencies, statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kiosks", type=int, nargs="+", default=[8, 32, 64], help="concurrent simulated kiosks")
+    parser.add_argument("--per-kiosk", type=int, default=5, help="registrations per kiosk")
+    parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads per process")
+    parser.add_argument("--upload-ms", type=float, default=500, help="time for one upload to arrive")
+    parser.add_argument("--workers", type=int, default=0, help="RENDER_WORKERS for both apps")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["STORAGE_ROOT"] = tmp
+    upload = args.upload_ms / 1000
+    print(f"{args.per_kiosk} registrations per kiosk, {args.upload_ms:.0f} ms uploads, "
+          f"{args.threads} WSGI threads, RENDER_WORKERS={args.workers}, {os.cpu_count()} CPUs")
+    print(f"{'app':>5} {'kiosks':>6} {'p50':>8} {'p95':>8} {'req/s':>7} {'errors':>6}  (ms)")
+    for kiosks in args.kiosks:
+        for name in ("wsgi", "asgi"):
+            if name == "wsgi":
+                latencies, statuses, elapsed = run_sync(tmp, kiosks, args.per_kiosk, args.threads,
+                                                        upload, args.workers)
+            else:
+                latencies, statuses, elapsed = run_async(tmp, kiosks, args.per_kiosk, upload, args.workers)
+            ms = sorted(l * 1000 for l in latencies)
+            errors = sum(1 for s in statuses if s != 200)
+            print(f"{name:>5} {kiosks:6d} {statistics.median(ms):8.0f} {percentile(ms, 95):8.0f} "
+                  f"{len(ms) / elapsed:7.1f} {errors:6d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+/submit latency with N kiosks registering visitors at the same time.
+
+Starts the kiosk app on a local port (a threaded server, like gunicorn
+with threads) with a temporary database and storage, then has --kiosks
+threads each post --per-kiosk multipart registrations back to back.
+Reports p50/p95/p99 latency until each registration succeeded (kiosks
+retry a 503 after its Retry-After), throughput, and how many attempts
+were turned away with 503. Run once per --workers value; 0 renders on the request
+thread, the way /submit worked before the render pool.
+
+    python benchmarks/load_submit.py [--kiosks 8] [--per-kiosk 10] [--workers 0 4]
+    python benchmarks/load_submit.py --url http://kiosk:5000   # an already running kiosk
+"""
+import argparse
+import io
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+FIELDS = {
+    "firstName": "Jane", "lastName": "Doe", "email": "jane@example.com",
+    "phone": "0912345678", "purpose": "Meeting", "finding": "Mr. Lee",
+}
+
+
+def make_jpeg(seed):
+    # A webcam-sized frame; a different one per kiosk so storage can't dedupe
+    image = Image.merge("RGB", [Image.linear_gradient("L").resize((1280, 720)),
+                                Image.radial_gradient("L").resize((1280, 720)),
+                                Image.new("L", (1280, 720), seed % 256)])
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def serve(port, workers):
+    """--serve mode: run the kiosk app in this process."""
+    from werkzeug.serving import make_server
+    from kasvisitor import create_app
+
+    # Exit normally on terminate so the render pool's processes are shut down too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    tmp = tempfile.mkdtemp()
+    os.environ["STORAGE_ROOT"] = tmp
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'visitors.db')}",
+                      "RENDER_WORKERS": workers}, role="kiosk")
+    make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+
+
+def start_server(workers):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, __file__, "--serve", str(port), "--workers", str(workers)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            urllib.request.urlopen(url + "/api/print-jobs", timeout=1)
+            return proc, url
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("kiosk server did not start")
+
+
+def kiosk(url, photo, count, latencies, statuses):
+    """One kiosk registering count visitors; a 503 is retried after Retry-After."""
+    boundary, body = encode_multipart({**FIELDS, "photo": FileStorage(io.BytesIO(photo), "photo.jpg")})
+    for _ in range(count):
+        request = urllib.request.Request(
+            url + "/submit", data=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+        start = time.perf_counter()
+        while True:
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+                statuses.append(status)
+                if status == 503:
+                    time.sleep(float(e.headers.get("Retry-After", 1)))
+                    continue
+            else:
+                statuses.append(status)
+            break
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, p):
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+def run(url, kiosks, per_kiosk):
+    latencies, statuses = [], []
+    threads = [threading.Thread(target=kiosk, args=(url, make_jpeg(i), per_kiosk, latencies, statuses))
+               for i in range(kiosks)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    ms = sorted(l * 1000 for l in latencies)
+    return (percentile(ms, 50), percentile(ms, 95), percentile(ms, 99),
+            len(ms) / elapsed, statuses.count(503), sum(1 for s in statuses if s not in (200, 503)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kiosks", type=int, default=8, help="concurrent simulated kiosks")
+    parser.add_argument("--per-kiosk", type=int, default=10, help="registrations per kiosk")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4], help="RENDER_WORKERS to compare")
+    parser.add_argument("--url", help="load an already running kiosk instead")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.workers[0])
+        return
+
+    print(f"{args.kiosks} kiosks x {args.per_kiosk} registrations, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>7} {'503s':>5} {'errors':>6}  (ms)")
+    for workers in ([None] if args.url else args.workers):
+        proc, url = (None, args.url) if args.url else start_server(workers)
+        try:
+            run(url, 1, 2)  # warm up
+            p50, p95, p99, rate, busy, errors = run(url, args.kiosks, args.per_kiosk)
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait()
+        label = "-" if workers is None else workers
+        print(f"{label:>8} {p50:8.0f} {p95:8.0f} {p99:8.0f} {rate:7.1f} {busy:5d} {errors:6d}")
+
+
+if __name__ == '__main__':
+    main()
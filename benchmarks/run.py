@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for the registration, printing and admin hot paths.
+
+Runs every benchmark against a temporary SQLite database and storage
+directory, with a simulated printer in place of the QL-800, and writes a
+JSON report. Pass an earlier report with --compare to see the change in
+median time per benchmark; the exit status is 1 if any got slower than
+--threshold, so this can gate a deploy.
+
+    python benchmarks/run.py [--sizes 1000 10000 100000] [--rounds 10]
+                             [--only submit] [--json report.json]
+                             [--compare baseline.json] [--threshold 0.15]
+
+Reports are only comparable between runs on the same machine.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+
+from badge import raster_instructions
+from bench_visitors_api import add_rows
+from kasvisitor import PrintJob, Visitor, create_app, db
+from kasvisitor import printing
+from kasvisitor.labels import get_label_raster
+from kasvisitor.printers import PrinterRegistry, SimulatedPrinter
+from kasvisitor.rendering import encode_photo, render_visitor_badge
+
+FIELDS = {
+    "firstName": "Jane", "lastName": "Doe", "email": "jane@example.com",
+    "phone": "0912345678", "purpose": "Meeting", "finding": "Mr. Lee",
+}
+PACKAGES = ("Flask", "SQLAlchemy", "Pillow", "brother_ql", "reportlab")
+
+
+def webcam_jpeg():
+    frame = Image.merge("RGB", [Image.linear_gradient("L").resize((1280, 720)),
+                                Image.radial_gradient("L").resize((1280, 720)),
+                                Image.effect_noise((1280, 720), 24)])
+    out = io.BytesIO()
+    frame.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+class Suite:
+    """The app, a logged-in client and a registered visitor shared by the benchmarks."""
+
+    def __init__(self, tmp):
+        os.environ["STORAGE_ROOT"] = tmp
+        self.app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'visitors.db')}",
+                               "REQUEST_LOG": False})
+        self.storage = self.app.extensions["storage"]
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+        self.jpeg = webcam_jpeg()
+        self.app.extensions["printers"] = PrinterRegistry([SimulatedPrinter("bench")])
+
+        self.submit()
+        with self.app.app_context():
+            self.visitor_id = Visitor.query.order_by(Visitor.id.desc()).first().id
+
+    def visitor(self):
+        return db.session.get(Visitor, self.visitor_id)
+
+    # Registration path
+
+    def save_photo(self):
+        photo_jpeg, _ = encode_photo(io.BytesIO(self.jpeg))
+        self.storage.put("photos", photo_jpeg, ".jpg")
+
+    def badge_pdf(self):
+        with self.app.app_context():
+            render_visitor_badge(self.visitor(), self.storage).write_pdf(io.BytesIO())
+
+    def label_raster(self):
+        with self.app.app_context():
+            badge = render_visitor_badge(self.visitor(), self.storage)
+        raster_instructions([badge])
+
+    def label_cached(self):
+        with self.app.app_context():
+            get_label_raster(self.visitor(), self.storage)
+
+    def print_run(self, jobs=5):
+        with self.app.app_context():
+            db.session.add_all([PrintJob(visitor_id=self.visitor_id) for _ in range(jobs)])
+            db.session.commit()
+            while printing.process_print_jobs():
+                pass
+
+    def submit(self):
+        response = self.client.post("/submit", data=dict(FIELDS, photo=(io.BytesIO(self.jpeg), "photo.jpg")))
+        assert response.status_code == 200, response.get_json()
+
+    # Admin path
+
+    def visitors_first_page(self):
+        assert self.client.get("/api/visitors").status_code == 200
+
+    def visitors_filtered(self):
+        assert self.client.get("/api/visitors?q=smith&purpose=Tour&from=2024-01-02").status_code == 200
+
+    def visitors_search(self):
+        assert self.client.get("/api/visitors/search?q=chen").status_code in (200, 501)
+
+
+def measure(fn, rounds):
+    fn()  # warm up caches, connections and lazy imports
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    ms = [s * 1000 for s in samples]
+    return {
+        "rounds": rounds,
+        "min_ms": round(ms[0], 3),
+        "median_ms": round(statistics.median(ms), 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "stdev_ms": round(statistics.stdev(ms), 3) if len(ms) > 1 else 0.0,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    packages = {}
+    for name in PACKAGES:
+        try:
+            packages[name] = version(name)
+        except PackageNotFoundError:
+            packages[name] = None
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "packages": packages,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline report; returns the names that regressed."""
+    regressed = []
+    print(f"\n{'benchmark':<34} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if before is None:
+            print(f"{name:<34} {'-':>10} {result['median_ms']:10.2f} {'new':>8}")
+            continue
+        change = result["median_ms"] / before["median_ms"] - 1
+        flag = "  SLOWER" if change > threshold else ""
+        if flag:
+            regressed.append(name)
+        print(f"{name:<34} {before['median_ms']:10.2f} {result['median_ms']:10.2f} {change:+8.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="visitor table sizes for the admin benchmarks")
+    parser.add_argument("--rounds", type=int, default=10, help="timed rounds per benchmark")
+    parser.add_argument("--only", help="run only benchmarks whose name contains this")
+    parser.add_argument("--json", default="benchmark_report.json", help="where to write the report")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="slowdown in median time that counts as a regression (0.15 = 15%%)")
+    args = parser.parse_args()
+    logging.getLogger("kasvisitor").setLevel(logging.WARNING)
+
+    results = {}
+
+    def run(name, fn, rounds=args.rounds):
+        if args.only and args.only not in name:
+            return
+        results[name] = measure(fn, rounds)
+        r = results[name]
+        print(f"{name:<34} {r['median_ms']:10.2f} {r['p95_ms']:10.2f} {r['min_ms']:10.2f} {r['rounds']:7d}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        suite = Suite(tmp)
+        print(f"{'benchmark':<34} {'median ms':>10} {'p95 ms':>10} {'min ms':>10} {'rounds':>7}")
+        run("registration.save_photo", suite.save_photo)
+        run("registration.badge_pdf", suite.badge_pdf)
+        run("registration.label_raster", suite.label_raster)
+        run("registration.submit", suite.submit)
+        run("printing.label_cached", suite.label_cached)
+        run("printing.print_run_5_jobs", suite.print_run, rounds=max(args.rounds // 2, 1))
+
+        admin = [("admin.visitors_first_page", suite.visitors_first_page),
+                 ("admin.visitors_filtered", suite.visitors_filtered),
+                 ("admin.visitors_search", suite.visitors_search)]
+        total = 0
+        for size in sorted(args.sizes):
+            selected = [(f"{name}@{size}", fn) for name, fn in admin]
+            selected = [(name, fn) for name, fn in selected if not args.only or args.only in name]
+            if not selected:
+                continue
+            add_rows(suite.app, total, size - total)
+            total = size
+            for name, fn in selected:
+                run(name, fn)
+
+    report = {"environment": environment(), "benchmarks": results}
+    with open(args.json, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.json}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressed = compare(results, baseline, args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
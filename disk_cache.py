@@ -0,0 +1,122 @@
+"""
+Size-bounded on-disk cache for derived files (thumbnails and the like).
+
+Entries are plain files under one directory, created with the first
+entry. Recency is the file's mtime, bumped on every hit, so
+least-recently-used eviction survives restarts and works when several
+processes share the directory.
+"""
+import os
+import tempfile
+import threading
+
+
+class BoundedDiskCache:
+    """
+    Files keyed by relative name, kept under max_bytes in total. When a put
+    goes over the limit the least recently used files are removed until the
+    cache is back under low_water (a fraction of max_bytes).
+    """
+
+    def __init__(self, directory, max_bytes, low_water=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._size = None
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Path of a cached entry, or None. Marks the entry as recently used."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, data):
+        """Store bytes under key (atomically) and return the entry's path."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict(keep=path)
+        return path
+
+    def keys(self):
+        """Names of the entries, relative to the cache directory."""
+        for _, _, path in self._entries():
+            yield os.path.relpath(path, self.directory)
+
+    def discard(self, keys):
+        """Remove the entries for keys, if they exist; returns how many were removed."""
+        removed = freed = 0
+        for key in keys:
+            path = self.path(key)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += size
+        with self._lock:
+            if self._size is not None:
+                self._size -= freed
+        return removed
+
+    def get_or_create(self, key, factory):
+        """Path of the entry for key, calling factory() for its bytes on a miss."""
+        path = self.get(key)
+        if path is None:
+            path = self.put(key, factory())
+        return path
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self, keep):
+        # Re-scan rather than trust the running total: other processes may
+        # have added or evicted entries in the meantime.
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for _, size, path in entries:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
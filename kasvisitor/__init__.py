@@ -0,0 +1,146 @@
+"""
+KAS visitor system: the kiosk, the admin panel and badge printing as one
+Flask application.
+
+    app = create_app()              # everything (development)
+    app = create_app(role="kiosk")  # registration + print queue API
+    app = create_app(role="admin")  # admin panel
+
+Every role shares the models, the database engine and the file storage, so
+the kiosk and the admin panel can run as separate gunicorn services on the
+same database, e.g.
+
+    gunicorn 'kasvisitor:create_app(role="kiosk")'
+
+The kiosk can also be served by an ASGI server (see asgi.py).
+"""
+import os
+
+import click
+from flask import Flask
+from flask_cors import CORS
+
+from disk_cache import BoundedDiskCache
+from storage import storage_from_env
+from thumbnails import THUMBNAIL_CACHE_BYTES
+from visitor_search import search_index_ready
+
+from . import admin, assets, files, kiosk, metrics
+from .assets import AssetBundle
+from .config import PROJECT_ROOT, config_from_env
+from .database import configure_engine, engine_options, upgrade_schema
+from .extensions import db
+from .idempotency import IdempotencyCache
+from .labels import LABEL_CACHE_BYTES
+from .models import PrintJob, PrinterStatus, Registration, Visitor, VisitRollup
+from .pdfs import PDF_CACHE_BYTES
+from .printers import PrinterRegistry
+from .registrations import prerender_badges
+from .retention import RetentionPolicy, apply_retention, dry_run
+from .stats import rebuild_rollups, rebuild_start
+from .rendering import RenderPool
+
+ROLES = {
+    "kiosk": (kiosk.bp, files.bp, assets.bp),
+    "admin": (admin.bp, files.bp, assets.bp),
+    "all": (kiosk.bp, admin.bp, files.bp, assets.bp),
+}
+
+
+def create_app(config=None, role="all", render_pool=True):
+    """
+    Build the app for a role ("kiosk", "admin" or "all"). 'config' overrides
+    the settings read from the environment (see config.py). Processes that
+    don't serve requests, like print_worker.py, pass render_pool=False so
+    they don't start RENDER_WORKERS idle render processes.
+    """
+    # The front-end files (index.html, admin.html, scripts, styles) live in
+    # the project root, and a relative SQLite path is resolved against it.
+    # Only the files listed in assets.py are served from there.
+    app = Flask(__name__, root_path=PROJECT_ROOT, static_folder=None)
+    app.config.update(config_from_env())
+    if config:
+        app.config.update(config)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
+
+    # Enable CORS for all routes and origins
+    CORS(app, resources={r"/*": {"origins": "*"}})
+
+    db.init_app(app)
+    configure_engine(app)
+    metrics.init_app(app)
+    app.extensions["storage"] = storage_from_env()
+    app.extensions["assets"] = AssetBundle(PROJECT_ROOT)
+    app.extensions["printers"] = PrinterRegistry.from_config(app.config["PRINTERS"])
+    app.extensions["idempotency"] = IdempotencyCache(app.config["IDEMPOTENCY_WINDOW"])
+    # Disk caches of renders; the directories are created with their first entry
+    app.extensions["thumbnail_cache"] = BoundedDiskCache(
+        os.path.join(PROJECT_ROOT, app.config["THUMBNAIL_CACHE_DIR"]), THUMBNAIL_CACHE_BYTES)
+    app.extensions["pdf_cache"] = BoundedDiskCache(
+        os.path.join(PROJECT_ROOT, app.config["PDF_CACHE_DIR"]), PDF_CACHE_BYTES)
+    app.extensions["label_cache"] = BoundedDiskCache(
+        os.path.join(PROJECT_ROOT, app.config["LABEL_CACHE_DIR"]), LABEL_CACHE_BYTES)
+
+    with app.app_context():
+        if app.config["SCHEMA_AUTO_UPGRADE"]:
+            upgrade_schema()
+        app.extensions["search_enabled"] = search_index_ready(db.engine)
+
+    for blueprint in ROLES[role]:
+        app.register_blueprint(blueprint)
+    workers = app.config["RENDER_WORKERS"]
+    if render_pool and kiosk.bp in ROLES[role] and workers > 0:
+        queue_depth = app.config["RENDER_QUEUE_DEPTH"]
+        if queue_depth is None:
+            queue_depth = 2 * workers
+        app.extensions["render_pool"] = RenderPool(workers, queue_depth, app.config["RENDER_TIMEOUT"])
+
+    @app.cli.command("init-db")
+    def init_db():
+        """Create or upgrade the database schema."""
+        upgrade_schema()
+        click.echo("Database schema is up to date.")
+
+    @app.cli.command("prerender-badges")
+    def prerender_missing_badges():
+        """Render the badges of pre-registered visitors that don't have one yet."""
+        total = 0
+        while True:
+            rendered = prerender_badges()
+            if not rendered:
+                break
+            total += rendered
+        click.echo(f"Rendered {total} badge(s).")
+
+    @app.cli.command("build-assets")
+    @click.argument("directory")
+    def build_assets(directory):
+        """Write hashed, precompressed assets, manifest.json and nginx.conf to DIRECTORY."""
+        app.extensions["assets"].write(directory)
+        click.echo(f"Assets written to {directory}; include {directory}/nginx.conf in the nginx server block.")
+
+    @app.cli.command("retention")
+    @click.option("--dry-run", "dry_run_only", is_flag=True, help="Only report what would be archived and deleted.")
+    def retention(dry_run_only):
+        """Apply RETENTION_ARCHIVE_DAYS and RETENTION_PURGE_DAYS now."""
+        policy = RetentionPolicy.from_config(app.config)
+        if not policy.enabled:
+            click.echo("No retention policy is configured.")
+            return
+        report = dry_run(policy) if dry_run_only else apply_retention(policy)
+        for name, value in report.items():
+            click.echo(f"{name}: {value}")
+
+    @app.cli.command("backfill-stats")
+    @click.option("--since", type=click.DateTime(["%Y-%m-%d"]),
+                  help="First day to recount (default: every day the retention purge hasn't touched).")
+    def backfill_stats(since):
+        """Recount the visitor statistics from the visitor table."""
+        since = since.date() if since else rebuild_start(RetentionPolicy.from_config(app.config))
+        counted = rebuild_rollups(since)
+        click.echo(f"Counted {counted} visit(s) {f'since {since}' if since else 'in total'}.")
+
+    return app
+
+
+__all__ = ["create_app", "db", "Visitor", "PrintJob", "PrinterStatus", "Registration", "VisitRollup"]
@@ -0,0 +1,493 @@
+"""
+Admin panel: login, the visitor list and search, the live feed of new
+visitors, visitor statistics, visitor log exports, guest list imports, the
+retention report, and photo thumbnails.
+"""
+import base64
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from flask import (Blueprint, Response, current_app, jsonify, redirect, request, send_file, session,
+                   stream_with_context, url_for)
+
+from thumbnails import THUMBNAIL_SIZES, get_thumbnail, thumbnail_format
+from visitor_search import build_match_query, matching_ids, search_visitor_ids
+
+from .export import EXPORT_FORMATS, export_visitors, parquet_available
+from .extensions import db, get_assets, get_storage, get_thumbnail_cache, search_enabled
+from .metrics import log
+from .models import Visitor
+from .registrations import InvalidImport, import_registrations, read_import_rows, start_badge_prerender
+from .retention import RetentionPolicy, dry_run
+from .stats import STATS_DIMENSIONS, STATS_PERIODS, query_rollups
+
+bp = Blueprint("admin", __name__)
+
+# For demo purposes, hardcode admin credentials
+ADMIN_USERNAME = "danielchen"
+ADMIN_PASSWORD = "password"
+
+# /api/visitors page sizes
+VISITORS_PAGE_SIZE = 50
+VISITORS_MAX_PAGE_SIZE = 200
+
+# Thumbnail size used in the visitor table, and how long browsers may reuse
+# a thumbnail before revalidating it
+TABLE_THUMBNAIL_SIZE = 128
+THUMBNAIL_MAX_AGE = 24 * 3600
+
+# /api/visitors/stream: how often the database is checked for new visitors,
+# how often an idle stream sends a keep-alive, and how long one stream lasts
+# before the browser is asked to reconnect (each open stream holds a
+# server thread, so serve the admin app with threaded workers)
+STREAM_POLL_INTERVAL = 1.0
+STREAM_KEEPALIVE = 15
+STREAM_MAX_SECONDS = 300
+STREAM_RETRY_MS = 3000
+STREAM_BATCH_SIZE = 100
+
+# Longest /api/stats range, in buckets, so a query reads a bounded number of rows
+STATS_MAX_HOURS = 31 * 24
+STATS_MAX_DAYS = 366
+
+
+# --------- Authentication Routes --------- #
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'GET':
+        # Simple login page
+        return """
+        <!DOCTYPE html>
+<html>
+<head>
+  <title>Admin Login</title>
+  <style>
+    /* Ensure padding doesn't expand elements beyond their declared width */
+    * {
+      box-sizing: border-box;
+    }
+
+    body {
+      font-family: Arial, sans-serif;
+      background: #f5f5f5;
+      margin: 0; /* remove default margin for consistency */
+      padding: 0;
+    }
+
+    .login-container {
+      width: 400px;         /* fixed width on larger screens */
+      max-width: 90%;       /* allow it to shrink on smaller screens */
+      margin: 100px auto;   /* centers horizontally */
+      padding: 1rem;
+      background: #fff;
+      border: 1px solid #ccc;
+      border-radius: 4px;
+    }
+
+    .login-container h2 {
+      margin-bottom: 1rem;  /* add some spacing below heading */
+    }
+
+    input {
+      width: 100%;          /* fill container width */
+      padding: 0.5rem;
+      margin-bottom: 1rem;
+      border: 1px solid #ccc;
+      border-radius: 4px;
+    }
+
+    button {
+      width: 100%;          /* make the button match input width for consistency */
+      padding: 0.5rem;
+      background: #00573d;
+      color: #fff;
+      border: none;
+      border-radius: 4px;
+      cursor: pointer;
+    }
+
+    button:hover {
+      background: #007f57;
+    }
+  </style>
+</head>
+<body>
+  <div class="login-container">
+    <h2>Admin Login</h2>
+    <form method="POST" action="/login">
+      <input type="text" name="username" placeholder="Username" required>
+      <input type="password" name="password" placeholder="Password" required>
+      <button type="submit">Login</button>
+    </form>
+  </div>
+</body>
+</html>
+        """
+    else:
+        username = request.form.get('username')
+        password = request.form.get('password')
+        if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
+            session['logged_in'] = True
+            return redirect(url_for('admin.admin_panel'))
+        else:
+            return "Invalid credentials. <a href='/login'>Try again</a>"
+
+
+@bp.route('/logout')
+def logout():
+    session.pop('logged_in', None)
+    return redirect(url_for('admin.login'))
+
+
+# --------- Admin Panel Routes --------- #
+@bp.route('/admin')
+def admin_panel():
+    if not session.get('logged_in'):
+        return redirect(url_for('admin.login'))
+    return get_assets().page("admin.html")
+
+
+def visitor_to_dict(v):
+    return {
+        "id": v.id,
+        "full_name": f"{v.first_name} {v.last_name}",
+        "purpose": v.purpose,
+        "created_at": v.created_at.isoformat(),
+        "finding": v.finding,
+        "email": v.email,      # Added email
+        "phone": v.phone,      # Added phone number
+        "photo_download": f"/{v.photo_path}" if v.photo_path else None,
+        "photo_thumb": f"/thumbs/{TABLE_THUMBNAIL_SIZE}/{v.photo_path}" if v.photo_path else None,
+        "photo_archived": v.photo_archive is not None,
+        "pdf_download": f"/{v.pdf_key}"
+    }
+
+
+def encode_cursor(v):
+    """Opaque cursor pointing just past visitor v in newest-first order."""
+    raw = f"{v.created_at.isoformat()}|{v.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, visitor_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(created_at), int(visitor_id)
+
+
+def parse_datetime_arg(value):
+    """
+    ISO date or datetime from the query string, as naive UTC like created_at.
+    """
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+@bp.route('/api/visitors', methods=['GET'])
+def get_visitors():
+    """
+    One page of visitors, newest first. Query parameters (all optional):
+      - q: words matched (as prefixes) against name, email, phone, purpose
+        and finding; full name or purpose substring without FTS5
+      - purpose, finding: filter on those fields
+      - from, to: ISO date/datetime range on created_at
+      - limit: page size (default 50, max 200)
+      - cursor: next_cursor from the previous page
+    """
+    if not session.get('logged_in'):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    query = Visitor.query
+    args = request.args
+
+    q = args.get('q', '').strip()
+    if q and search_enabled():
+        match = build_match_query(q)
+        if match:
+            query = query.filter(Visitor.id.in_(matching_ids(match)))
+    elif q:
+        pattern = f"%{q}%"
+        full_name = Visitor.first_name + " " + Visitor.last_name
+        query = query.filter(db.or_(full_name.ilike(pattern), Visitor.purpose.ilike(pattern)))
+    if args.get('purpose'):
+        query = query.filter(Visitor.purpose == args['purpose'])
+    if args.get('finding'):
+        query = query.filter(Visitor.finding.ilike(f"%{args['finding'].strip()}%"))
+
+    try:
+        if args.get('from'):
+            query = query.filter(Visitor.created_at >= parse_datetime_arg(args['from']))
+        if args.get('to'):
+            query = query.filter(Visitor.created_at < parse_datetime_arg(args['to']))
+        if args.get('cursor'):
+            cursor_created_at, cursor_id = decode_cursor(args['cursor'])
+            query = query.filter(db.tuple_(Visitor.created_at, Visitor.id) < (cursor_created_at, cursor_id))
+        limit = min(max(int(args.get('limit', VISITORS_PAGE_SIZE)), 1), VISITORS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters."}), 400
+
+    # Fetch one extra row to know whether there is a next page
+    visitors = (query.order_by(Visitor.created_at.desc(), Visitor.id.desc())
+                .limit(limit + 1)
+                .all())
+    next_cursor = encode_cursor(visitors[limit - 1]) if len(visitors) > limit else None
+    return jsonify({
+        "visitors": [visitor_to_dict(v) for v in visitors[:limit]],
+        "next_cursor": next_cursor
+    })
+
+
+@bp.route('/api/visitors/search', methods=['GET'])
+def search_visitors():
+    """
+    Visitors matching ?q= across name, email, phone, purpose and finding,
+    best match first. Each word matches as a prefix. ?limit= caps the results.
+    """
+    if not session.get('logged_in'):
+        return jsonify({"error": "Unauthorized"}), 401
+    if not search_enabled():
+        return jsonify({"error": "Full-text search is not available."}), 501
+
+    match = build_match_query(request.args.get('q', ''))
+    if not match:
+        return jsonify({"visitors": []})
+    try:
+        limit = min(max(int(request.args.get('limit', VISITORS_PAGE_SIZE)), 1), VISITORS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters."}), 400
+
+    ids = search_visitor_ids(db.session, match, limit)
+    by_id = {v.id: v for v in Visitor.query.filter(Visitor.id.in_(ids))}
+    return jsonify({"visitors": [visitor_to_dict(by_id[i]) for i in ids if i in by_id]})
+
+
+@bp.route('/api/visitors/stream', methods=['GET'])
+def stream_visitors():
+    """
+    Server-Sent Events feed of visitors as they are registered, oldest
+    first, one "visitor" event per row with the visitor id as event id.
+    Starts after the Last-Event-ID header (sent by EventSource when it
+    reconnects) or ?after=<id>, and otherwise with the next new visitor.
+    Any process may register visitors; the feed polls the visitor table
+    for ids above the last one sent.
+    """
+    if not session.get('logged_in'):
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('after') or -1)
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters."}), 400
+    if last_id < 0:
+        last_id = db.session.query(db.func.max(Visitor.id)).scalar() or 0
+
+    def events(last_id):
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            visitors = [visitor_to_dict(v) for v in (Visitor.query
+                                                     .filter(Visitor.id > last_id)
+                                                     .order_by(Visitor.id)
+                                                     .limit(STREAM_BATCH_SIZE))]
+            # Don't hold a pooled connection while the stream is idle
+            db.session.remove()
+            for visitor in visitors:
+                yield f"id: {visitor['id']}\nevent: visitor\ndata: {json.dumps(visitor)}\n\n"
+                last_id = visitor['id']
+            if visitors:
+                last_sent = time.monotonic()
+                if len(visitors) == STREAM_BATCH_SIZE:
+                    continue
+            elif time.monotonic() - last_sent >= STREAM_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(STREAM_POLL_INTERVAL)
+
+    return Response(stream_with_context(events(last_id)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@bp.route('/api/visitors/export', methods=['GET'])
+def export_visitor_log():
+    """
+    Every visitor in a date range, streamed oldest first. Query parameters:
+      - format: csv (default), ndjson or parquet (needs pyarrow)
+      - from, to: ISO date/datetime range on created_at
+      - photos=1: a zip of the log and the photos it refers to
+    """
+    if not session.get('logged_in'):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    args = request.args
+    fmt = args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "Invalid query parameters."}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({"error": "Parquet export is not available."}), 501
+    filters = []
+    try:
+        if args.get('from'):
+            filters.append(Visitor.created_at >= parse_datetime_arg(args['from']))
+        if args.get('to'):
+            filters.append(Visitor.created_at < parse_datetime_arg(args['to']))
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters."}), 400
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    storage = None
+    if args.get('photos') == '1':
+        storage = get_storage()
+        mimetype, extension = "application/zip", "zip"
+    filename = "-".join(["visitors"] + [args[k][:10] for k in ('from', 'to') if args.get(k)])
+    return Response(stream_with_context(export_visitors(fmt, filters, storage)), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'})
+
+
+@bp.route('/api/registrations/import', methods=['POST'])
+def import_guest_list():
+    """
+    Pre-register the visitors expected at an event. The guest list is a CSV
+    file with a header row or a JSON list of objects, sent as the request
+    body or as the 'file' part of a form, with the fields first_name,
+    last_name, email, phone, purpose, finding and expected_on (ISO date).
+    Names and a phone or email are required. Badges are rendered in the
+    background after the import.
+    """
+    if not session.get('logged_in'):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    upload = request.files.get('file')
+    if upload:
+        stream = upload.stream
+        is_json = upload.mimetype == 'application/json' or upload.filename.lower().endswith('.json')
+    else:
+        stream = request.stream
+        is_json = request.is_json
+    try:
+        imported, rejected, errors = import_registrations(read_import_rows(stream, "json" if is_json else "csv"))
+    except InvalidImport as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+    if imported:
+        start_badge_prerender(current_app._get_current_object())
+    return jsonify({"imported": imported, "rejected": rejected, "errors": errors}), 201 if imported else 400
+
+
+def stats_range(period, args):
+    """
+    [start, end) of a /api/stats query, as rollup starts: UTC hours (default
+    the last 24) or local dates (default the last 30 days, today included).
+    """
+    if period == "hour":
+        now = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        end = parse_datetime_arg(args['to']) if args.get('to') else now
+        start = parse_datetime_arg(args['from']) if args.get('from') else end - timedelta(hours=24)
+        return start, end, timedelta(hours=STATS_MAX_HOURS)
+    end = date.fromisoformat(args['to']) if args.get('to') else date.today() + timedelta(days=1)
+    start = date.fromisoformat(args['from']) if args.get('from') else end - timedelta(days=30)
+    midnight = datetime.min.time()
+    return datetime.combine(start, midnight), datetime.combine(end, midnight), timedelta(days=STATS_MAX_DAYS)
+
+
+@bp.route('/api/stats', methods=['GET'])
+def visitor_stats():
+    """
+    Visit counts from the precomputed rollups (see stats.py). Query
+    parameters (all optional):
+      - period: hour (UTC hours) or day (local dates, the default)
+      - by: total (the default), purpose or finding (the host)
+      - from, to: ISO datetimes for hours, ISO dates for days; 'to' is
+        exclusive. At most 31 days of hours or 366 days.
+    Returns the total per bucket (series), the busiest bucket (peak) and,
+    by purpose or host, the count per bucket and value (breakdown) and per
+    value over the range (totals, busiest first).
+    """
+    if not session.get('logged_in'):
+        return jsonify({"error": "Unauthorized"}), 401
+    period = request.args.get('period', 'day')
+    by = request.args.get('by', 'total')
+    if period not in STATS_PERIODS or by not in STATS_DIMENSIONS:
+        return jsonify({"error": f"period must be one of {', '.join(STATS_PERIODS)}, "
+                                 f"by one of {', '.join(STATS_DIMENSIONS)}."}), 400
+    try:
+        start, end, longest = stats_range(period, request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters."}), 400
+    if not start < end <= start + longest:
+        return jsonify({"error": "from must be before to, and the range at most 31 days of hours "
+                                 "or 366 days."}), 400
+
+    def bucket(start):
+        return start.isoformat() if period == "hour" else start.date().isoformat()
+
+    series = query_rollups(period, "total", start, end)
+    peak = max(series, key=lambda row: row.visits, default=None)
+    result = {
+        "period": period,
+        "by": by,
+        "from": bucket(start),
+        "to": bucket(end),
+        "total": sum(row.visits for row in series),
+        "series": [{"start": bucket(row.start), "visits": row.visits} for row in series],
+        "peak": {"start": bucket(peak.start), "visits": peak.visits} if peak else None,
+    }
+    if by != "total":
+        breakdown = query_rollups(period, by, start, end)
+        totals = {}
+        for row in breakdown:
+            totals[row.value] = totals.get(row.value, 0) + row.visits
+        result["breakdown"] = [{"start": bucket(row.start), "value": row.value, "visits": row.visits}
+                               for row in breakdown]
+        result["totals"] = [{"value": value, "visits": visits}
+                            for value, visits in sorted(totals.items(), key=lambda item: -item[1])]
+    return jsonify(result)
+
+
+@bp.route('/api/retention', methods=['GET'])
+def retention_report():
+    """
+    Dry run of the retention policies: how many photos would be archived,
+    PDFs and rows deleted, and how many bytes that frees.
+    """
+    if not session.get('logged_in'):
+        return jsonify({"error": "Unauthorized"}), 401
+    policy = RetentionPolicy.from_config(current_app.config)
+    if not policy.enabled:
+        return jsonify({"policy": policy.to_dict(), "enabled": False})
+    return jsonify(dict(dry_run(policy), enabled=True))
+
+
+@bp.route('/thumbs/<int:size>/photos/<path:filename>', methods=['GET'])
+def download_thumbnail(size, filename):
+    """
+    Resized visitor photo (WebP or JPEG, depending on Accept).
+    Browsers may reuse it for THUMBNAIL_MAX_AGE, then revalidate by ETag.
+    """
+    if not session.get('logged_in'):
+        return jsonify({"error": "Unauthorized"}), 401
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({"error": "Unsupported thumbnail size"}), 404
+    storage = get_storage()
+    photo_key = f"photos/{filename}"
+    if not storage.exists(photo_key):
+        return jsonify({"error": "Photo not found"}), 404
+
+    image_format, mimetype = thumbnail_format(request.headers.get("Accept"))
+    try:
+        thumb_path, etag = get_thumbnail(get_thumbnail_cache(), storage, photo_key, size, image_format)
+    except OSError as e:
+        log("thumbnail_failed", logging.ERROR, key=photo_key, error=e)
+        return jsonify({"error": "Photo could not be read"}), 404
+    response = send_file(os.path.abspath(thumb_path), mimetype=mimetype, etag=etag,
+                         last_modified=storage.modified_time(photo_key), max_age=THUMBNAIL_MAX_AGE)
+    # Visitor photos are personal data: browsers may cache them, shared proxies may not
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.vary.add("Accept")
+    return response
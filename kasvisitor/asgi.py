@@ -0,0 +1,376 @@
+"""
+The kiosk as an ASGI application, for an async server:
+
+    uvicorn --factory kasvisitor.asgi:create_asgi_app --port 5000
+
+Under the WSGI server a registration holds a worker thread from the first
+byte of the upload (slow over the kiosks' Wi-Fi) through the photo render,
+the file write and the database commit, so a process only has as many
+registrations in flight as it has threads. Here /submit runs on the event
+loop and only borrows a thread for each blocking step:
+
+  - the upload is received on the event loop;
+  - the photo is rendered in the render pool's processes (RENDER_WORKERS),
+    or on a small thread pool without one;
+  - parsing, the photo write and the database commit run on an I/O thread
+    pool as large as the database connection pool, each in its own
+    request context.
+
+Labels are printed by print_worker.py as with gunicorn; the printer's USB
+I/O never runs in a request. The response, status codes, metrics and log
+line are the same as from the Flask view (see kiosk.submit_visitor()).
+
+Every other route is the Flask app itself, called on an I/O thread with
+the request body already received (up to MAX_CONTENT_LENGTH, else 413).
+Its response is sent as the app produces it, so streamed responses (the
+admin's visitor stream and exports) stream here too; each chunk is read
+on an I/O thread.
+
+Request bodies are spooled: kept in memory up to BODY_SPOOL_BYTES, in a
+temporary file beyond that, so concurrent uploads don't each hold their
+whole body in RAM.
+"""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import g, jsonify
+from werkzeug.datastructures import EnvironHeaders
+
+from . import create_app
+from .idempotency import (IDEMPOTENCY_WAIT, InvalidIdempotencyKey, idempotency_key, in_progress_response,
+                          release_request, replayed_response)
+from .kiosk import (REGISTERED_MESSAGE, decode_photo_data_url, earlier_visit_response, quick_check_in,
+                    read_submission, render_pool_busy_response, request_too_large, save_registration,
+                    submission_fields)
+from .metrics import stage
+from .printing import print_worker_running
+from .rendering import InvalidPhoto, RenderPoolBusy, render_registration
+
+# Renders on threads without a render pool; they hold the GIL for most of it
+ASYNC_RENDER_THREADS = min(4, os.cpu_count() or 1)
+
+# Larger request bodies are spooled to a temporary file
+BODY_SPOOL_BYTES = 1024 * 1024
+
+
+def wsgi_environ(scope, body=None, size=0):
+    """
+    The WSGI environ of an ASGI HTTP request whose body (a file positioned
+    at its start, 'size' bytes long; None for no body) has been received.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "CONTENT_LENGTH": str(size),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body if body is not None else io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ[name] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+async def receive_body(receive, limit):
+    """
+    The request body as the client sends it, spooled, and its size: (file
+    positioned at the start, bytes). The caller closes the file. Raises
+    RequestTooLarge past 'limit' bytes.
+    """
+    body = tempfile.SpooledTemporaryFile(BODY_SPOOL_BYTES)
+    size = 0
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ConnectionError("client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if limit is not None and size > limit:
+                raise RequestTooLarge()
+            body.write(chunk)
+            if not message.get("more_body"):
+                body.seek(0)
+                return body, size
+    except BaseException:
+        body.close()
+        raise
+
+
+def response_start(status, headers):
+    """The http.response.start message: status code and (name, value) string pairs."""
+    return {"type": "http.response.start", "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]}
+
+
+async def send_response(send, status, headers, body):
+    """Send a complete response: status code, (name, value) string pairs and the body."""
+    await send(response_start(status, headers))
+    await send({"type": "http.response.body", "body": body})
+
+
+def request_state(scope):
+    """What the app's before_request hooks would set in g, for a request handled here."""
+    headers = dict(scope["headers"])
+    return {
+        "request_id": headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex,
+        "start": time.perf_counter(),
+        "stage_ms": {},
+        "idempotency_key": None,  # once claimed
+    }
+
+
+class KioskASGI:
+    """An ASGI application serving the kiosk Flask app, with /submit on the event loop."""
+
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.io_threads = ThreadPoolExecutor(config["DB_POOL_SIZE"] + config["DB_MAX_OVERFLOW"],
+                                             thread_name_prefix="kiosk-io")
+        self.render_threads = ThreadPoolExecutor(ASYNC_RENDER_THREADS, thread_name_prefix="kiosk-render")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            if scope["path"] == "/submit" and scope["method"] == "POST":
+                await self.submit(scope, receive, send)
+            else:
+                await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def shutdown(self):
+        self.io_threads.shutdown(wait=True)
+        self.render_threads.shutdown(wait=True)
+        pool = self.app.extensions.get("render_pool")
+        if pool is not None:
+            pool.shutdown()
+
+    async def wsgi(self, scope, receive, send):
+        """Any other route: the Flask app on an I/O thread, its response sent chunk by chunk."""
+        try:
+            body, size = await receive_body(receive, self.app.config["MAX_CONTENT_LENGTH"])
+        except ConnectionError:
+            return
+        except RequestTooLarge:
+            response = await self.respond(wsgi_environ(scope), request_state(scope), request_too_large, None)
+            await send_response(send, response.status_code, response.headers.to_wsgi_list(), response.get_data())
+            return
+
+        loop = asyncio.get_running_loop()
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(" ", 1)[0]), headers]
+
+        try:
+            result = await loop.run_in_executor(self.io_threads, self.app, wsgi_environ(scope, body, size),
+                                                start_response)
+            try:
+                # A streamed response's next chunk may take a while (the
+                # visitor stream waits for new visitors): never on the loop
+                chunks = iter(result)
+                chunk = await loop.run_in_executor(self.io_threads, next, chunks, None)
+                await send(response_start(*started))
+                while chunk is not None:
+                    if chunk:
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                    chunk = await loop.run_in_executor(self.io_threads, next, chunks, None)
+                await send({"type": "http.response.body", "body": b""})
+            finally:
+                if hasattr(result, "close"):
+                    await loop.run_in_executor(self.io_threads, result.close)
+        finally:
+            body.close()
+
+    async def submit(self, scope, receive, send):
+        """POST /submit with the same contract as kiosk.submit_visitor()."""
+        state = request_state(scope)
+        try:
+            with stage("upload", state["stage_ms"]):
+                body, size = await receive_body(receive, self.app.config["MAX_CONTENT_LENGTH"])
+        except ConnectionError:
+            return
+        except RequestTooLarge:
+            response = await self.respond(wsgi_environ(scope), state, request_too_large, None)
+        else:
+            response = None
+            try:
+                response = await self.register(wsgi_environ(scope, body, size), state)
+            finally:
+                body.close()
+                if state["idempotency_key"] is not None:
+                    with self.app.app_context():
+                        release_request(state["idempotency_key"], response)
+        await send_response(send, response.status_code, response.headers.to_wsgi_list(), response.get_data())
+
+    async def claim(self, environ, state):
+        """
+        Claim the Idempotency-Key like idempotency.claim_request(), but with
+        a duplicate waiting for the first request on the event loop: parked
+        on an I/O thread it could keep the first from getting one. Returns
+        the view of the response to send instead, if any.
+        """
+        try:
+            key = idempotency_key(EnvironHeaders(environ))
+        except InvalidIdempotencyKey as e:
+            error = str(e)
+            return lambda: (jsonify({"error": error}), 400)
+        if key is None:
+            return None
+        cache = self.app.extensions["idempotency"]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + IDEMPOTENCY_WAIT
+        while True:
+            cached, running = cache.try_claim(key)
+            if running is None:
+                break
+            # Done (or failed, and then the next waiter takes over)
+            done, _ = await asyncio.wait([asyncio.wrap_future(running)], timeout=deadline - loop.time())
+            if not done:
+                return in_progress_response
+        if cached is not None:
+            return lambda: replayed_response(cached)
+        state["idempotency_key"] = key
+        return None
+
+    async def register(self, environ, state):
+        claimed = await self.claim(environ, state)
+        if claimed is not None:
+            return await self.respond(environ, state, claimed)
+
+        # Parse the form (or do a whole quick check-in, which is only a DB write)
+        prepared = await self.in_context(environ, state, prepare_submission)
+        if not isinstance(prepared, Submission):
+            return await self.respond(environ, state, lambda: prepared)
+
+        # 1) Render, off the event loop
+        try:
+            with stage("render", state["stage_ms"]):
+                photo_jpeg, badge = await self.render(prepared)
+        except InvalidPhoto as e:
+            return await self.respond(environ, state, lambda: (jsonify({"error": str(e)}), 400))
+        except RenderPoolBusy:
+            return await self.respond(environ, state, render_pool_busy_response)
+
+        # 2) Store the photo and 3) commit, on an I/O thread
+        return await self.respond(environ, state, save_registration, prepared.fields, photo_jpeg, badge)
+
+    async def render(self, submission):
+        fields = submission.fields
+        text = (fields["first_name"], fields["last_name"], fields["purpose"], fields["finding"])
+        pool = self.app.extensions.get("render_pool")
+        if pool is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.render_threads, render_registration, *text, io.BytesIO(submission.photo),
+                submission.keep_badge)
+        executor, future = pool.submit(*text, submission.photo, submission.keep_badge)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), pool.timeout)
+        except asyncio.TimeoutError:
+            raise RenderPoolBusy()
+        except BrokenProcessPool:
+            await asyncio.get_running_loop().run_in_executor(self.io_threads, pool.restart, executor)
+            raise RenderPoolBusy()
+
+    def _call_in_context(self, environ, state, finish, view, args):
+        with self.app.request_context(environ):
+            g.request_id = state["request_id"]
+            g.request_start = state["start"]
+            g.stage_ms = state["stage_ms"]
+            if state["idempotency_key"] is not None:
+                g.idempotency_key = state["idempotency_key"]
+            try:
+                result = view(*args)
+            except Exception as e:
+                # As in Flask's own dispatch: logged and answered with a 500
+                result = self.app.handle_exception(e)
+            state["idempotency_key"] = g.get("idempotency_key")
+            if not finish:
+                return result
+            # The app's after_request hooks: CORS, X-Request-ID, metrics and the log line
+            return self.app.process_response(self.app.make_response(result))
+
+    async def in_context(self, environ, state, view, *args):
+        """view(*args) on an I/O thread, in a request context for this request."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.io_threads, self._call_in_context, environ, state, False, view, args)
+
+    async def respond(self, environ, state, view, *args):
+        """Like in_context(), with view's return value made into the final response."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.io_threads, self._call_in_context, environ, state, True, view, args)
+
+
+class Submission:
+    """A parsed registration, between the form and the render."""
+
+    def __init__(self, fields, photo, keep_badge):
+        self.fields = fields
+        self.photo = photo
+        self.keep_badge = keep_badge
+
+
+def prepare_submission():
+    """
+    A Submission from the request, or the response to send instead. The
+    Idempotency-Key is already claimed (KioskASGI.claim()).
+    """
+    data, photo_file = read_submission()
+    if data.get('returningVisitorId'):
+        return quick_check_in(data)
+    fields = submission_fields(data, photo_file)
+    if fields is None:
+        return jsonify({"error": "Missing required fields."}), 400
+    earlier = earlier_visit_response(REGISTERED_MESSAGE)
+    if earlier is not None:
+        return earlier
+    try:
+        photo = photo_file.read() if photo_file else decode_photo_data_url(data['photo'])
+    except InvalidPhoto as e:
+        return jsonify({"error": str(e)}), 400
+    return Submission(fields, photo, print_worker_running())
+
+
+def create_asgi_app(config=None):
+    """The kiosk role of create_app() as an ASGI application."""
+    return KioskASGI(create_app(config, role="kiosk"))
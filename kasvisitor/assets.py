@@ -0,0 +1,179 @@
+"""
+The front-end files (the kiosk and admin pages, their scripts and styles,
+the logo and the badge font), loaded once at startup and served from memory.
+
+Every asset also gets a name with a hash of its content (script.js ->
+/static/script.3fa9c1d2e4.js), served with a one-year immutable
+Cache-Control, and the pages refer to those names, so browsers only fetch
+an asset again after it changed. The pages themselves are served with
+no-cache and an ETag, so the kiosk's reload after each registration is
+answered with 304 Not Modified. Text assets are precompressed with gzip,
+and brotli when the brotli package is installed, and sent in the best
+encoding the browser accepts.
+
+The original names (/script.js, ...) still work, revalidated by ETag.
+Nothing else in the project directory is served. `flask build-assets DIR`
+writes the hashed and precompressed files with a manifest.json and an nginx
+snippet, for serving them from nginx instead.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from .extensions import get_assets
+
+PAGES = ("index.html", "admin.html")
+ASSETS = ("script.js", "styles.css", "admin.js", "admin.css", "logo.png", "BebasNeue-Regular.ttf")
+# Already compressed formats (PNG) gain nothing from gzip
+COMPRESSIBLE = (".html", ".js", ".css", ".ttf")
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+# href="styles.css", src="script.js"
+ASSET_REFERENCE = re.compile(r'\b(href|src)="([^"/:]+)"')
+
+bp = Blueprint("assets", __name__)
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class Asset:
+    """One file with its ETag and its bytes in each encoding (identity, gzip, br)."""
+
+    def __init__(self, name, data, hashed):
+        self.name = name
+        self.fingerprint = hashlib.sha256(data).hexdigest()[:10]
+        stem, extension = os.path.splitext(name)
+        self.url = f"/static/{stem}.{self.fingerprint}{extension}" if hashed else f"/{name}"
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.encodings = {"identity": data}
+        if extension in COMPRESSIBLE:
+            self.encodings["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+            brotli = _brotli()
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(data)
+            # Keep only encodings that are actually smaller
+            for encoding in ("gzip", "br"):
+                if encoding in self.encodings and len(self.encodings[encoding]) >= len(data):
+                    del self.encodings[encoding]
+
+    def response(self, immutable):
+        """The asset for the current request: 304, or the best encoding it accepts."""
+        if immutable:
+            cache_control = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        else:
+            cache_control = "no-cache"
+        if request.if_none_match.contains_weak(self.fingerprint):
+            response = Response(status=304)
+        else:
+            encoding = "identity"
+            for candidate in ("br", "gzip"):
+                if candidate in self.encodings and request.accept_encodings[candidate]:
+                    encoding = candidate
+                    break
+            response = Response(self.encodings[encoding], mimetype=self.mimetype)
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+        # Weak: the same tag stands for every encoding of the content
+        response.set_etag(self.fingerprint, weak=True)
+        response.headers["Cache-Control"] = cache_control
+        if len(self.encodings) > 1:
+            response.vary.add("Accept-Encoding")
+        return response
+
+
+class AssetBundle:
+    """The pages and assets under 'root', with the pages pointing at hashed asset names."""
+
+    def __init__(self, root):
+        self.root = root
+        self.load()
+
+    def _mtimes(self):
+        return {name: os.stat(os.path.join(self.root, name)).st_mtime_ns for name in PAGES + ASSETS}
+
+    def load(self):
+        self.mtimes = self._mtimes()
+        self.assets = {}
+        for name in ASSETS:
+            with open(os.path.join(self.root, name), "rb") as f:
+                self.assets[name] = Asset(name, f.read(), hashed=True)
+
+        def hashed_url(match):
+            asset = self.assets.get(match.group(2))
+            return f'{match.group(1)}="{asset.url}"' if asset else match.group(0)
+
+        self.pages = {}
+        for name in PAGES:
+            with open(os.path.join(self.root, name), encoding="utf-8") as f:
+                html = ASSET_REFERENCE.sub(hashed_url, f.read())
+            self.pages[name] = Asset(name, html.encode(), hashed=False)
+        self.hashed = {asset.url: asset for asset in self.assets.values()}
+
+    def reload_if_changed(self):
+        """Pick up edited files (for development; they are only read at startup otherwise)."""
+        if self._mtimes() != self.mtimes:
+            self.load()
+
+    def page(self, name):
+        return self.pages[name].response(immutable=False)
+
+    def manifest(self):
+        return {name: asset.url for name, asset in self.assets.items()}
+
+    def write(self, directory):
+        """
+        Write the hashed assets (with .gz/.br next to them), manifest.json
+        and nginx.conf to 'directory'. The pages stay with the apps.
+        """
+        static = os.path.join(directory, "static")
+        os.makedirs(static, exist_ok=True)
+        suffixes = {"identity": "", "gzip": ".gz", "br": ".br"}
+        for asset in self.assets.values():
+            path = os.path.join(directory, asset.url.lstrip("/"))
+            for encoding, data in asset.encodings.items():
+                with open(path + suffixes[encoding], "wb") as f:
+                    f.write(data)
+        with open(os.path.join(directory, "manifest.json"), "w") as f:
+            json.dump(self.manifest(), f, indent=2)
+        with open(os.path.join(directory, "nginx.conf"), "w") as f:
+            f.write(f"""# include inside the server block in front of the kiosk and admin apps
+location /static/ {{
+    alias {os.path.abspath(static)}/;
+    gzip_static on;
+    # brotli_static on;  # with the ngx_brotli module
+    add_header Cache-Control "public, max-age={STATIC_MAX_AGE}, immutable";
+}}
+""")
+
+
+@bp.before_app_request
+def _reload_assets():
+    if current_app.debug:
+        get_assets().reload_if_changed()
+
+
+@bp.route('/static/<path:filename>')
+def hashed_asset(filename):
+    asset = get_assets().hashed.get(f"/static/{filename}")
+    if asset is None:
+        return jsonify({"error": "Not found."}), 404
+    return asset.response(immutable=True)
+
+
+@bp.route('/<any(%s):filename>' % ", ".join(f'"{name}"' for name in ASSETS + ("index.html",)))
+def plain_asset(filename):
+    """Assets by their original names, for pages cached before they were hashed."""
+    bundle = get_assets()
+    asset = bundle.assets.get(filename) or bundle.pages[filename]
+    return asset.response(immutable=False)
@@ -0,0 +1,77 @@
+"""
+Configuration, read from environment variables when the app is created.
+
+  DATABASE_URL         SQLAlchemy URL (default: sqlite:///visitors.db next to
+                       the front-end files). postgresql://... switches to
+                       PostgreSQL (needs psycopg2).
+  DB_POOL_SIZE         connections kept open per process (default 5)
+  DB_MAX_OVERFLOW      extra connections allowed under load (default 10)
+  SQLITE_BUSY_TIMEOUT  ms a SQLite writer waits for the lock (default 15000)
+  SCHEMA_AUTO_UPGRADE  create missing tables/indexes at startup (default 1);
+                       set to 0 under gunicorn and run `flask init-db` once
+  SECRET_KEY           session signing key for the admin panel
+  RENDER_WORKERS       badge render processes for /submit (default 0:
+                       render on the request thread)
+  RENDER_QUEUE_DEPTH   registrations that may wait for a render process
+                       before /submit answers 503 (default 2 per worker)
+  RENDER_RETRY_AFTER   seconds kiosks are told to wait after a 503 (default 2)
+  PRINTERS             label printers as name=identifier, comma-separated
+                       (default ql800=usb://0x04f9:0x209b, see printers.py)
+  PRINTER_STATUS_INTERVAL  seconds between printer status polls (default 30)
+  RETENTION_ARCHIVE_DAYS  move photos of older visits into zip archives and
+                       delete their badge PDFs (default 0: never)
+  RETENTION_PURGE_DAYS delete older visits and guest list entries with their
+                       files (default 0: never); see retention.py
+  RETENTION_INTERVAL   seconds between background retention runs (default 3600)
+  IDEMPOTENCY_WINDOW   seconds a /submit response is kept to replay for a
+                       retry with the same Idempotency-Key (default 600)
+  THUMBNAIL_CACHE_DIR  admin photo thumbnails (default thumbnails)
+  PDF_CACHE_DIR        badge PDFs rendered on download (default pdf_cache)
+  LABEL_CACHE_DIR      converted printer labels (default raster_cache);
+                       a relative cache directory is under the project
+                       root, so every process of the app shares it
+  REQUEST_LOG          log one line per request with its id, status, time and
+                       /submit stage times (default 1)
+"""
+import os
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_DATABASE_URL = "sqlite:///visitors.db"
+DEFAULT_PRINTERS = "ql800=usb://0x04f9:0x209b"
+
+
+def database_url(url):
+    """Normalize a database URL; 'postgres://' is what many hosts hand out."""
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def config_from_env():
+    env = os.environ
+    return {
+        "SQLALCHEMY_DATABASE_URI": database_url(env.get("DATABASE_URL", DEFAULT_DATABASE_URL)),
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "DB_POOL_SIZE": int(env.get("DB_POOL_SIZE", 5)),
+        "DB_MAX_OVERFLOW": int(env.get("DB_MAX_OVERFLOW", 10)),
+        "SQLITE_BUSY_TIMEOUT": int(env.get("SQLITE_BUSY_TIMEOUT", 15000)),
+        "SCHEMA_AUTO_UPGRADE": env.get("SCHEMA_AUTO_UPGRADE", "1") != "0",
+        "SECRET_KEY": env.get("SECRET_KEY", "goddam"),  # Replace with a secure secret key
+        "RENDER_WORKERS": int(env.get("RENDER_WORKERS", 0)),
+        "RENDER_QUEUE_DEPTH": int(env["RENDER_QUEUE_DEPTH"]) if "RENDER_QUEUE_DEPTH" in env else None,
+        "RENDER_TIMEOUT": int(env.get("RENDER_TIMEOUT", 30)),
+        "RENDER_RETRY_AFTER": int(env.get("RENDER_RETRY_AFTER", 2)),
+        "PRINTERS": env.get("PRINTERS", DEFAULT_PRINTERS),
+        "PRINTER_STATUS_INTERVAL": float(env.get("PRINTER_STATUS_INTERVAL", 30)),
+        "RETENTION_ARCHIVE_DAYS": int(env.get("RETENTION_ARCHIVE_DAYS", 0)),
+        "RETENTION_PURGE_DAYS": int(env.get("RETENTION_PURGE_DAYS", 0)),
+        "RETENTION_INTERVAL": float(env.get("RETENTION_INTERVAL", 3600)),
+        "IDEMPOTENCY_WINDOW": float(env.get("IDEMPOTENCY_WINDOW", 600)),
+        "THUMBNAIL_CACHE_DIR": env.get("THUMBNAIL_CACHE_DIR", "thumbnails"),
+        "PDF_CACHE_DIR": env.get("PDF_CACHE_DIR", "pdf_cache"),
+        "LABEL_CACHE_DIR": env.get("LABEL_CACHE_DIR", "raster_cache"),
+        "REQUEST_LOG": env.get("REQUEST_LOG", "1") != "0",
+        # Uploaded photos: requests above this are refused with 413
+        "MAX_CONTENT_LENGTH": 16 * 1024 * 1024,
+    }
@@ -0,0 +1,122 @@
+"""
+Database engine setup and schema upgrades.
+
+The kiosk, the admin panel and the print worker usually run as separate
+processes on the same database. On SQLite that only works smoothly in WAL
+mode (readers don't block the writer and vice versa) with a busy timeout,
+so a writer waits for the lock instead of failing with "database is locked".
+Connections are pooled rather than opened per request.
+"""
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+from visitor_search import setup_search_index
+
+from .extensions import db
+from .stats import backfill_rollups
+
+
+def engine_options(config):
+    """create_engine() keyword arguments for the configured database."""
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            return options  # one shared connection (Flask-SQLAlchemy's StaticPool)
+        # Flask-SQLAlchemy defaults file databases to a new connection per
+        # checkout; keep them open instead. They move between threads.
+        options["poolclass"] = QueuePool
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["pool_pre_ping"] = True  # survive server restarts and idle timeouts
+        options["pool_recycle"] = 1800
+    options["pool_size"] = config["DB_POOL_SIZE"]
+    options["max_overflow"] = config["DB_MAX_OVERFLOW"]
+    return options
+
+
+def configure_engine(app):
+    """Set per-connection options; call before the engine's first connection."""
+    engine = db.get_engine(app)
+    if engine.dialect.name != "sqlite":
+        return
+    busy_timeout = int(app.config["SQLITE_BUSY_TIMEOUT"])
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        # Durable across application crashes in WAL mode, and much cheaper
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+
+
+def upgrade_schema():
+    """
+    Bring the database up to the current models: create missing tables, add
+    the columns and indexes create_all() doesn't add to existing tables, drop
+    NOT NULL from columns that became optional, set up the full-text index
+    and count existing visits into new visitor statistics. Safe to run
+    repeatedly. Needs an app context.
+    """
+    engine = db.engine
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        add_missing_columns(engine, table)
+        drop_stale_not_null(engine, table)
+    # create_all() leaves existing tables alone, so add indexes they are missing
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # Full-text index for the admin search (SQLite FTS5), backfilled if behind
+    setup_search_index(engine)
+    backfill_rollups()
+
+
+def add_missing_columns(engine, table):
+    """
+    ALTER TABLE ... ADD COLUMN for model columns the table doesn't have yet.
+    New NOT NULL columns need a server_default to fill the existing rows.
+    """
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    preparer = engine.dialect.identifier_preparer
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = CreateColumn(column).compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+
+
+def drop_stale_not_null(engine, table):
+    """
+    Make columns nullable in the database where the model now allows NULL.
+    SQLite can't alter a column, so there the table is rebuilt; its indexes
+    and triggers are dropped with it and recreated by upgrade_schema().
+    """
+    inspected = {column["name"]: column for column in inspect(engine).get_columns(table.name)}
+    relaxed = [column.name for column in table.columns
+               if column.nullable and not inspected[column.name]["nullable"]]
+    if not relaxed:
+        return
+    preparer = engine.dialect.identifier_preparer
+    name = preparer.format_table(table)
+    if engine.dialect.name != "sqlite":
+        with engine.begin() as conn:
+            for column in relaxed:
+                conn.execute(text(f"ALTER TABLE {name} ALTER COLUMN {preparer.quote(column)} DROP NOT NULL"))
+        return
+
+    # https://www.sqlite.org/lang_altertable.html#otheralter
+    rebuilt = table.to_metadata(db.MetaData(), name=f"_{table.name}_rebuild")
+    columns = ", ".join(preparer.quote(column.name) for column in table.columns)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {preparer.format_table(rebuilt)}"))  # left by a crash
+        conn.execute(CreateTable(rebuilt))
+        conn.execute(text(f"INSERT INTO {preparer.format_table(rebuilt)} ({columns}) "
+                          f"SELECT {columns} FROM {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+        conn.execute(text(f"ALTER TABLE {preparer.format_table(rebuilt)} RENAME TO {name}"))
@@ -0,0 +1,165 @@
+"""
+Visitor log exports (/api/visitors/export) as CSV, NDJSON or Parquet,
+optionally zipped together with the photos the rows refer to.
+
+Exports are generators of byte chunks. Rows come from a server-side cursor
+EXPORT_CHUNK_SIZE at a time and each chunk is written out before the next
+one is fetched, so memory use stays the same however many rows there are.
+Parquet needs pyarrow, which is optional.
+"""
+import csv
+import io
+import json
+import logging
+import zipfile
+from datetime import datetime
+
+from .extensions import db
+from .metrics import log
+from .models import Visitor
+
+EXPORT_CHUNK_SIZE = 1000
+# Photos are copied into the zip this many bytes at a time
+EXPORT_PHOTO_BLOCK_SIZE = 256 * 1024
+
+EXPORT_COLUMNS = ("id", "first_name", "last_name", "email", "phone", "purpose",
+                  "finding", "created_at", "photo_path")
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _ChunkSink:
+    """Write-only file collecting the bytes of the next response chunk."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._size = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._size
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _visitor_chunks(filters):
+    """Lists of up to EXPORT_CHUNK_SIZE rows (EXPORT_COLUMNS), in id order."""
+    columns = [getattr(Visitor, name) for name in EXPORT_COLUMNS]
+    statement = (db.select(*columns).where(*filters).order_by(Visitor.id)
+                 .execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    yield from db.session.execute(statement).partitions()
+
+
+def _values(row):
+    return [value.isoformat() if isinstance(value, datetime) else value for value in row]
+
+
+def _write_csv(chunks, out):
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(_values(row) for row in rows)
+        out.write(text.getvalue().encode())
+        text.seek(0)
+        text.truncate()
+        yield
+
+
+def _write_ndjson(chunks, out):
+    for rows in chunks:
+        out.write("".join(json.dumps(dict(zip(EXPORT_COLUMNS, _values(row)))) + "\n"
+                          for row in rows).encode())
+        yield
+
+
+def _write_parquet(chunks, out):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.int64() if name == "id" else
+                         pa.timestamp("us") if name == "created_at" else pa.string())
+                        for name in EXPORT_COLUMNS])
+    # One row group per chunk; the footer is written when the writer closes
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema))
+            yield
+
+
+WRITERS = {"csv": _write_csv, "ndjson": _write_ndjson, "parquet": _write_parquet}
+
+
+def export_visitors(fmt, filters=(), storage=None):
+    """
+    The visitors matching the SQLAlchemy 'filters' in format 'fmt' (a key of
+    EXPORT_FORMATS), as a generator of bytes. With a storage backend the
+    export is a zip of visitors.<ext> and the photos, stored under their
+    photo_path.
+    """
+    data = _ChunkSink()
+    written = WRITERS[fmt](_visitor_chunks(filters), data)
+    if storage is None:
+        for _ in written:
+            yield data.drain()
+        yield data.drain()
+        return
+
+    out = _ChunkSink()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(f"visitors.{EXPORT_FORMATS[fmt][1]}", "w", force_zip64=True) as entry:
+            for _ in written:
+                entry.write(data.drain())
+                yield out.drain()
+            entry.write(data.drain())
+        yield from _zip_photos(archive, out, filters, storage)
+    yield out.drain()
+
+
+def _zip_photos(archive, out, filters, storage):
+    statement = (db.select(Visitor.photo_path).where(Visitor.photo_path.isnot(None), *filters)
+                 .distinct().order_by(Visitor.photo_path).execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    for (photo_path,) in db.session.execute(statement):
+        try:
+            photo = storage.open(photo_path)
+        except OSError:
+            log("export_photo_missing", logging.WARNING, key=photo_path)
+            continue
+        # JPEGs don't compress any further
+        info = zipfile.ZipInfo(photo_path, datetime.now().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        with photo, archive.open(info, "w", force_zip64=True) as entry:
+            while True:
+                block = photo.read(EXPORT_PHOTO_BLOCK_SIZE)
+                if not block:
+                    break
+                entry.write(block)
+                yield out.drain()
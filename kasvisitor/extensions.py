@@ -0,0 +1,53 @@
+"""
+Extension objects shared by every blueprint. They are bound to an app in
+create_app(), so importing this module has no side effects.
+"""
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+
+def get_storage():
+    """The photo/PDF storage backend of the current app (see storage.py)."""
+    return current_app.extensions["storage"]
+
+
+def search_enabled():
+    """Whether the SQLite FTS5 visitor index exists for the current app."""
+    return current_app.extensions["search_enabled"]
+
+
+def get_assets():
+    """The front-end pages and assets, loaded at startup (see assets.py)."""
+    return current_app.extensions["assets"]
+
+
+def get_printers():
+    """The label printer registry (see printers.py)."""
+    return current_app.extensions["printers"]
+
+
+def get_idempotency_cache():
+    """Recent /submit responses by Idempotency-Key (see idempotency.py)."""
+    return current_app.extensions["idempotency"]
+
+
+def get_thumbnail_cache():
+    """The admin panel's photo thumbnails (see thumbnails.py)."""
+    return current_app.extensions["thumbnail_cache"]
+
+
+def get_pdf_cache():
+    """Badge PDFs rendered on download (see pdfs.py)."""
+    return current_app.extensions["pdf_cache"]
+
+
+def get_label_cache():
+    """Printer labels as raster instructions (see labels.py)."""
+    return current_app.extensions["label_cache"]
+
+
+def get_render_pool():
+    """The badge render process pool, or None to render on the request thread."""
+    return current_app.extensions.get("render_pool")
@@ -0,0 +1,57 @@
+"""
+Downloads of stored visitor photos and badge PDFs.
+"""
+import logging
+import os
+
+from flask import Blueprint, jsonify, redirect, request, send_file
+
+from .extensions import get_storage
+from .metrics import log
+from .models import Visitor
+from .pdfs import badge_pdf_visitor_id, get_badge_pdf
+
+bp = Blueprint("files", __name__)
+
+
+def send_stored_file(key, not_found_message):
+    """
+    Response for a storage key: the file itself for local storage, a
+    redirect to a short-lived URL for object storage. ?download=1 asks the
+    browser to save the file rather than show it.
+    """
+    storage = get_storage()
+    path = storage.local_path(key)
+    if path:
+        return send_file(path, as_attachment=request.args.get('download') == '1')
+    if storage.exists(key):
+        return redirect(storage.url(key))
+    return jsonify({"error": not_found_message}), 404
+
+
+@bp.route('/pdfs/<path:filename>', methods=['GET'])
+def download_pdf(filename):
+    """
+    Badge PDF: rendered on demand for badge-<id>-<fingerprint>.pdf names,
+    from storage for PDFs written at registration by older versions.
+    """
+    visitor_id = badge_pdf_visitor_id(filename)
+    if visitor_id is None:
+        return send_stored_file(f"pdfs/{filename}", "PDF not found.")
+
+    visitor = Visitor.query.get(visitor_id)
+    # A stale fingerprint means the row changed since the link was handed out
+    if visitor is None or visitor.pdf_key != f"pdfs/{filename}":
+        return jsonify({"error": "PDF not found."}), 404
+    try:
+        path = get_badge_pdf(visitor, get_storage())
+    except OSError as e:
+        log("badge_pdf_failed", logging.ERROR, visitor_id=visitor.id, error=e)
+        return jsonify({"error": "PDF could not be rendered."}), 404
+    return send_file(os.path.abspath(path), mimetype="application/pdf",
+                     as_attachment=request.args.get('download') == '1', download_name=filename)
+
+
+@bp.route('/photos/<path:filename>', methods=['GET'])
+def download_photo(filename):
+    return send_stored_file(f"photos/{filename}", "Photo not found.")
@@ -0,0 +1,176 @@
+"""
+Idempotent /submit. The kiosk sends an Idempotency-Key header with each
+registration: a new key per visitor, the same one when staff tap "finish"
+again after a timeout. The visit is then recorded, rendered and printed
+once, however often it is retried:
+
+  - a successful response is kept for IDEMPOTENCY_WINDOW seconds in a small
+    per-process cache and replayed as is, with Idempotent-Replayed: true;
+  - a duplicate arriving while the first request is still running waits
+    for it (IDEMPOTENCY_WAIT seconds at most, then 409) instead of doing
+    the work a second time; under the ASGI app it waits on the event loop
+    (see asgi.KioskASGI.claim()), not on a thread;
+  - the key is also stored on the Visitor row, unique, so a retry that
+    misses the cache (another process, a restart, an expired entry) gets
+    the visit already recorded rather than a second one (see
+    kiosk.earlier_visit_response()).
+
+Failed requests are not kept: retrying them with the same key does the work.
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+
+from flask import Response, current_app, g, jsonify, request
+
+from .extensions import get_idempotency_cache
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+IDEMPOTENCY_CACHE_SIZE = 1000  # responses kept per process
+IDEMPOTENCY_WAIT = 30          # seconds a duplicate waits for the first request
+
+
+class RequestInProgress(Exception):
+    """Another request with the same key is still running."""
+
+
+class InvalidIdempotencyKey(ValueError):
+    pass
+
+
+class IdempotencyCache:
+    """Recent responses by key, and the keys of requests still running."""
+
+    def __init__(self, window, size=IDEMPOTENCY_CACHE_SIZE):
+        self.window = window
+        self.size = size
+        self._responses = OrderedDict()  # key -> (expires, status, body, mimetype)
+        self._running = {}               # key -> Future done when the request is
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        entry = self._responses.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._responses[key]
+            return None
+        return entry[1:]
+
+    def try_claim(self, key):
+        """
+        claim() without waiting: (cached, None), cached being what claim()
+        returns, or (None, future) while another request with the key runs;
+        the future is done when it is, and then the caller tries again.
+        """
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached, None
+            running = self._running.get(key)
+            if running is None:
+                self._running[key] = Future()
+            return None, running
+
+    def claim(self, key, timeout=IDEMPOTENCY_WAIT):
+        """
+        The cached (status, body, mimetype) for 'key', or None if the caller
+        now runs the request and must call release(). While another request
+        with the key runs, waits for it; raises RequestInProgress after 'timeout'.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            cached, running = self.try_claim(key)
+            if running is None:
+                return cached
+            # Done (or failed, and then the next waiter takes over)
+            try:
+                running.result(deadline - time.monotonic())
+            except TimeoutError:
+                raise RequestInProgress()
+
+    def release(self, key, response=None):
+        """Done with 'key'; keep 'response' (status, body, mimetype) for replays if given."""
+        with self._lock:
+            if response is not None:
+                self._responses[key] = (time.monotonic() + self.window, *response)
+                self._responses.move_to_end(key)
+                while len(self._responses) > self.size:
+                    self._responses.popitem(last=False)
+            self._running.pop(key).set_result(None)
+
+
+def idempotency_key(headers):
+    """The Idempotency-Key in 'headers', or None; raises InvalidIdempotencyKey if it is malformed."""
+    key = headers.get(IDEMPOTENCY_HEADER, "").strip()
+    if not key:
+        return None
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH or not key.isprintable():
+        raise InvalidIdempotencyKey(f"{IDEMPOTENCY_HEADER} must be at most "
+                                    f"{IDEMPOTENCY_KEY_MAX_LENGTH} printable characters.")
+    return key
+
+
+def in_progress_response():
+    response = jsonify({"error": "This registration is still being processed."})
+    response.headers["Retry-After"] = "1"
+    return response, 409
+
+
+def replayed_response(cached):
+    status, body, mimetype = cached
+    response = Response(body, status=status, mimetype=mimetype)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def claim_request():
+    """
+    Claim the current request's Idempotency-Key (as g.idempotency_key).
+    Returns the response to send instead, if any: the replayed original, a
+    409 while it is still running, or a 400 for a malformed key.
+    """
+    try:
+        key = idempotency_key(request.headers)
+    except InvalidIdempotencyKey as e:
+        return jsonify({"error": str(e)}), 400
+    if key is None:
+        return None
+    try:
+        cached = get_idempotency_cache().claim(key)
+    except RequestInProgress:
+        return in_progress_response()
+    if cached is not None:
+        return replayed_response(cached)
+    g.idempotency_key = key
+    return None
+
+
+def release_request(key, response):
+    """Release a claimed key, keeping 'response' (a Response, or None if it failed) if it succeeded."""
+    kept = None
+    if response is not None and response.status_code == 200:
+        kept = (response.status_code, response.get_data(), response.mimetype)
+    get_idempotency_cache().release(key, kept)
+
+
+def idempotent(view):
+    """Make a view idempotent for requests with an Idempotency-Key header."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        claimed = claim_request()
+        if claimed is not None:
+            return claimed
+        key = g.get("idempotency_key")
+        if key is None:
+            return view(*args, **kwargs)
+        response = None
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+            return response
+        finally:
+            release_request(key, response)
+    return wrapper
@@ -0,0 +1,441 @@
+"""
+Kiosk: visitor registration, quick check-in of returning and pre-registered
+visitors, and the print queue API.
+"""
+import base64
+import io
+import logging
+
+from flask import Blueprint, current_app, g, jsonify, request
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db, get_assets, get_render_pool, get_storage
+from .idempotency import idempotent
+from .metrics import log, render_pool_busy, stage
+from .models import PrintJob, PrinterStatus, Registration, Visitor
+from .printing import PRINT_MAX_COPIES, hand_off_badge, print_worker_running
+from .stats import record_visit
+from .rendering import InvalidPhoto, RenderPoolBusy, render_registration
+
+bp = Blueprint("kiosk", __name__)
+
+# Most visitors a single print request may name
+PRINT_REQUEST_MAX_VISITORS = 200
+
+# Most pre-registrations returned by one lookup
+REGISTRATION_LOOKUP_LIMIT = 20
+
+
+def decode_photo_data_url(photo_base64):
+    """
+    Photo bytes from the legacy JSON payload (a data URL or bare base64).
+    """
+    if "," in photo_base64:
+        photo_base64 = photo_base64.split(",", 1)[1]
+    try:
+        return base64.b64decode(photo_base64)
+    except ValueError:
+        raise InvalidPhoto("Photo is not valid base64.")
+
+
+REQUIRED_FIELDS = ('firstName', 'lastName', 'email', 'phone', 'purpose', 'finding')
+
+REGISTERED_MESSAGE = "Visitor registered successfully."
+WELCOME_BACK_MESSAGE = "Welcome back."
+
+
+@bp.route('/submit', methods=['POST'])
+@idempotent
+def submit_visitor():
+    """
+    Expects either multipart/form-data (preferred) with fields:
+      - firstName
+      - lastName
+      - email
+      - phone
+      - purpose
+      - finding
+      - photo (file part, any image format Pillow reads)
+    or the original JSON payload with the same keys and 'photo' as a
+    Base64 data URL.
+
+    A returning visitor (see /api/returning-visitors) only needs
+    returningVisitorId, the phone or email they looked themselves up by,
+    purpose and finding: the visit reuses the details and the stored photo
+    of their earlier one.
+
+    With an Idempotency-Key header, a retry gets the first response back
+    instead of a second visit (see idempotency.py).
+
+    Each numbered stage below is timed (kas_submit_stage_seconds on
+    /metrics, and the request's log line). asgi.py serves the same
+    contract without holding a thread while waiting.
+    """
+    data, photo_file = read_submission()
+    if data.get('returningVisitorId'):
+        return quick_check_in(data)
+    fields = submission_fields(data, photo_file)
+    if fields is None:
+        return jsonify({"error": "Missing required fields."}), 400
+    earlier = earlier_visit_response(REGISTERED_MESSAGE)
+    if earlier is not None:
+        return earlier
+
+    # 1) Re-encode the photo to a bounded JPEG (and compose the badge if an
+    #    in-process print worker will take it), in a render process if configured.
+    #    The PDF is only rendered when someone downloads it.
+    pool = get_render_pool()
+    keep_badge = print_worker_running()
+    try:
+        with stage("render"):
+            if pool is None:
+                if photo_file is None:
+                    photo_file = io.BytesIO(decode_photo_data_url(data['photo']))
+                photo_jpeg, badge = render_registration(
+                    fields['first_name'], fields['last_name'], fields['purpose'], fields['finding'],
+                    photo_file, keep_badge)
+            else:
+                photo_bytes = photo_file.read() if photo_file else decode_photo_data_url(data['photo'])
+                photo_jpeg, badge = pool.render(
+                    fields['first_name'], fields['last_name'], fields['purpose'], fields['finding'],
+                    photo_bytes, keep_badge)
+    except InvalidPhoto as e:
+        return jsonify({"error": str(e)}), 400
+    except RenderPoolBusy:
+        return render_pool_busy_response()
+
+    # 2) Store the photo, 3) save the DB record and queue the label for the print worker
+    return save_registration(fields, photo_jpeg, badge)
+
+
+def read_submission():
+    """(form data, photo upload or None) of a /submit request, multipart or JSON."""
+    with stage("parse"):
+        if request.mimetype == 'multipart/form-data':
+            return request.form, request.files.get('photo')
+        return request.get_json(silent=True) or {}, None
+
+
+def submission_fields(data, photo_file):
+    """The new visit's Visitor columns, or None if a field or the photo is missing."""
+    if not all(data.get(field) for field in REQUIRED_FIELDS) or not (photo_file or data.get('photo')):
+        return None
+    return {
+        "first_name": data['firstName'].strip(),
+        "last_name": data['lastName'].strip(),
+        "email": data['email'].strip(),
+        "phone": data['phone'].strip(),
+        "purpose": data['purpose'].strip(),
+        "finding": data['finding'].strip(),
+        "idempotency_key": g.get("idempotency_key"),
+    }
+
+
+def render_pool_busy_response():
+    render_pool_busy.inc()
+    response = jsonify({"error": "The kiosk is busy, please try again in a moment."})
+    response.headers['Retry-After'] = str(current_app.config['RENDER_RETRY_AFTER'])
+    return response, 503
+
+
+def save_registration(fields, photo_jpeg, badge):
+    """
+    The last stages of /submit: store the re-encoded photo, insert the visit
+    and its print job, and hand the composed badge (if any) to the print worker.
+    """
+    try:
+        with stage("store_photo"):
+            photo_key = get_storage().put("photos", photo_jpeg, ".jpg")
+    except OSError as e:
+        log("photo_save_failed", logging.ERROR, error=e)
+        return jsonify({"error": "Failed to save photo."}), 500
+
+    visitor = Visitor(photo_path=photo_key, **fields)
+    print_job = PrintJob(visitor=visitor)
+    if not commit_visit(visitor, print_job):
+        return earlier_visit_response(REGISTERED_MESSAGE)
+    hand_off_badge(print_job.id, badge)
+    return visit_response(visitor, print_job, REGISTERED_MESSAGE)
+
+
+def commit_visit(visitor, print_job):
+    """
+    Insert a new visit and its print job. Returns False, with nothing
+    inserted, if another request recorded a visit under the same
+    Idempotency-Key in the meantime.
+    """
+    with stage("db_commit"):
+        db.session.add(visitor)
+        db.session.add(print_job)
+        record_visit(visitor)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            # Only the unique Idempotency-Key means a duplicate; anything else is a real error
+            key = visitor.idempotency_key
+            if key is None or Visitor.query.filter_by(idempotency_key=key).first() is None:
+                raise
+            return False
+    return True
+
+
+def visit_response(visitor, print_job, message):
+    return jsonify({
+        "success": True,
+        "message": message,
+        "pdfDownloadLink": f"/{visitor.pdf_key}",
+        "photoDownloadLink": f"/{visitor.photo_path}" if visitor.photo_path else None,
+        "printJobId": print_job.id
+    })
+
+
+def earlier_visit_response(message):
+    """
+    The response for the visit already recorded under this request's
+    Idempotency-Key (by another process, or before a restart), or None.
+    """
+    key = g.get("idempotency_key")
+    if key is None:
+        return None
+    visitor = Visitor.query.filter_by(idempotency_key=key).first()
+    if visitor is None:
+        return None
+    print_job = PrintJob.query.filter_by(visitor_id=visitor.id).order_by(PrintJob.id).first()
+    response = visit_response(visitor, print_job, message)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def quick_check_in(data):
+    """
+    /submit for a returning visitor: a new visit with the details of an
+    earlier one and their latest stored photo, so there is no photo to
+    upload, decode, re-encode or store. The print worker composes the badge
+    from the row.
+
+    The kiosk is unauthenticated, so the visitor id alone is not enough:
+    the request must carry the phone or email of that earlier visit.
+    """
+    phone = str(data.get('phone') or '').strip()
+    email = str(data.get('email') or '').strip()
+    if not (data.get('purpose') and data.get('finding')) or not (phone or email):
+        return jsonify({"error": "Missing required fields."}), 400
+    try:
+        previous = Visitor.query.get(int(data['returningVisitorId']))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid returningVisitorId."}), 400
+    # Same answer for a wrong id and for a phone or email that doesn't match
+    if previous is None or (previous.phone != phone if phone else previous.email != email):
+        return jsonify({"error": "Visitor not found."}), 404
+    earlier = earlier_visit_response(WELCOME_BACK_MESSAGE)
+    if earlier is not None:
+        return earlier
+
+    visitor = Visitor(
+        first_name=previous.first_name,
+        last_name=previous.last_name,
+        email=previous.email,
+        phone=previous.phone,
+        purpose=data['purpose'].strip(),
+        finding=data['finding'].strip(),
+        photo_path=previous.photo_path or latest_photo_path(previous.phone),
+        idempotency_key=g.get("idempotency_key")
+    )
+    print_job = PrintJob(visitor=visitor)
+    if not commit_visit(visitor, print_job):
+        return earlier_visit_response(WELCOME_BACK_MESSAGE)
+    return visit_response(visitor, print_job, WELCOME_BACK_MESSAGE)
+
+
+def latest_photo_path(phone):
+    """Storage key of the most recent photo taken of the visitor with this phone."""
+    row = (db.session.query(Visitor.photo_path)
+           .filter(Visitor.phone == phone, Visitor.photo_path.isnot(None))
+           .order_by(Visitor.id.desc())
+           .first())
+    return row.photo_path if row else None
+
+
+@bp.route('/api/returning-visitors', methods=['GET'])
+def find_returning_visitor():
+    """
+    The latest visit of a visitor, by exact ?phone= or ?email=, so the
+    kiosk can offer quick check-in. 404 for someone who hasn't visited
+    before. The kiosk is unauthenticated, so only enough is sent back for
+    visitors to recognise themselves: the first name, the last name's
+    initial and the purpose; no photo, host or contact details.
+    """
+    phone = request.args.get('phone', '').strip()
+    email = request.args.get('email', '').strip()
+    if not phone and not email:
+        return jsonify({"error": "Expected phone or email."}), 400
+    query = Visitor.query.filter(Visitor.phone == phone) if phone else Visitor.query.filter(Visitor.email == email)
+    visitor = query.order_by(Visitor.id.desc()).first()
+    if visitor is None:
+        return jsonify({"error": "Visitor not found."}), 404
+
+    return jsonify({
+        "visitorId": visitor.id,
+        "name": f"{visitor.first_name} {visitor.last_name[:1]}.".strip(),
+        "purpose": visitor.purpose
+    })
+
+
+@bp.app_errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": "Upload too large."}), 413
+
+
+@bp.route('/api/registrations', methods=['GET'])
+def find_registrations():
+    """
+    Pre-registered visitors who haven't checked in yet, by exact ?phone= or
+    ?email=, earliest expected first.
+    """
+    phone = request.args.get('phone', '').strip()
+    email = request.args.get('email', '').strip()
+    if not phone and not email:
+        return jsonify({"error": "Expected phone or email."}), 400
+    query = Registration.query.filter(Registration.visitor_id.is_(None))
+    if phone:
+        query = query.filter(Registration.phone == phone)
+    else:
+        query = query.filter(Registration.email == email)
+    registrations = (query.order_by(Registration.expected_on, Registration.id)
+                     .limit(REGISTRATION_LOOKUP_LIMIT)
+                     .all())
+    return jsonify([registration.to_dict() for registration in registrations])
+
+
+@bp.route('/api/registrations/<int:registration_id>/check-in', methods=['POST'])
+def check_in_registration(registration_id):
+    """
+    Check in a pre-registered visitor: record the visit and print the badge
+    rendered at import, without the kiosk form or a photo.
+    """
+    registration = Registration.query.get(registration_id)
+    if registration is None:
+        return jsonify({"error": "Registration not found."}), 404
+    if registration.visitor_id is not None:
+        return jsonify({"error": "Already checked in.", "visitorId": registration.visitor_id}), 409
+
+    visitor = Visitor(
+        first_name=registration.first_name,
+        last_name=registration.last_name,
+        email=registration.email,
+        phone=registration.phone,
+        purpose=registration.purpose,
+        finding=registration.finding
+    )
+    db.session.add(visitor)
+    db.session.flush()
+    # Claim the registration; a second kiosk checking in the same guest loses
+    claimed = (Registration.query
+               .filter_by(id=registration_id, visitor_id=None)
+               .update({"visitor_id": visitor.id}, synchronize_session=False))
+    if not claimed:
+        db.session.rollback()
+        return jsonify({"error": "Already checked in."}), 409
+    print_job = PrintJob(visitor=visitor)
+    db.session.add(print_job)
+    record_visit(visitor)
+    # The print worker loads the pre-rendered badge (rendering.render_visitor_badge())
+    db.session.commit()
+
+    return jsonify({
+        "success": True,
+        "message": "Visitor checked in successfully.",
+        "visitorId": visitor.id,
+        "pdfDownloadLink": f"/{visitor.pdf_key}",
+        "printJobId": print_job.id
+    })
+
+
+@bp.route('/api/print-jobs', methods=['GET'])
+def list_print_jobs():
+    """
+    Latest print jobs, newest first. Optional ?status=queued|printing|done|failed.
+    """
+    query = PrintJob.query
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    jobs = query.order_by(PrintJob.id.desc()).limit(100).all()
+    return jsonify([job.to_dict() for job in jobs])
+
+
+@bp.route('/api/print-jobs', methods=['POST'])
+def create_print_jobs():
+    """
+    Queue badge labels for visitors who are already registered, e.g. a
+    group arriving together or spare copies of one badge. JSON body:
+      - visitor_ids: list of visitor ids (or visitor_id: a single id)
+      - copies: labels per visitor (default 1, max 50)
+    Jobs queued together are printed in one run, cut between labels.
+    """
+    data = request.get_json(silent=True) or {}
+    visitor_ids = data.get('visitor_ids')
+    if visitor_ids is None and data.get('visitor_id') is not None:
+        visitor_ids = [data['visitor_id']]
+    copies = data.get('copies', 1)
+    if (not isinstance(visitor_ids, list) or not visitor_ids
+            or not all(isinstance(i, int) for i in visitor_ids)
+            or not isinstance(copies, int)):
+        return jsonify({"error": "Expected visitor_ids (list of ints) and optional copies (int)."}), 400
+    if len(visitor_ids) > PRINT_REQUEST_MAX_VISITORS:
+        return jsonify({"error": f"At most {PRINT_REQUEST_MAX_VISITORS} visitors per request."}), 400
+    if not 1 <= copies <= PRINT_MAX_COPIES:
+        return jsonify({"error": f"copies must be between 1 and {PRINT_MAX_COPIES}."}), 400
+
+    found = {row.id for row in db.session.query(Visitor.id).filter(Visitor.id.in_(visitor_ids))}
+    missing = [i for i in visitor_ids if i not in found]
+    if missing:
+        return jsonify({"error": "Visitor not found.", "visitor_ids": missing}), 404
+
+    jobs = [PrintJob(visitor_id=visitor_id, copies=copies) for visitor_id in visitor_ids]
+    db.session.add_all(jobs)
+    db.session.commit()
+    return jsonify([job.to_dict() for job in jobs]), 201
+
+
+@bp.route('/api/visitors/<int:visitor_id>/reprint', methods=['POST'])
+def reprint_badge(visitor_id):
+    """
+    Print a registered visitor's badge again, e.g. a lost one. Optional
+    JSON body: copies (default 1, max 50). The label was cached when it
+    was first printed, so the worker only has to send it.
+    """
+    data = request.get_json(silent=True) or {}
+    copies = data.get('copies', 1)
+    if not isinstance(copies, int) or not 1 <= copies <= PRINT_MAX_COPIES:
+        return jsonify({"error": f"copies must be between 1 and {PRINT_MAX_COPIES}."}), 400
+    if Visitor.query.get(visitor_id) is None:
+        return jsonify({"error": "Visitor not found."}), 404
+    job = PrintJob(visitor_id=visitor_id, copies=copies)
+    db.session.add(job)
+    db.session.commit()
+    return jsonify(job.to_dict()), 201
+
+
+@bp.route('/api/print-jobs/<int:job_id>', methods=['GET'])
+def get_print_job(job_id):
+    job = PrintJob.query.get(job_id)
+    if job is None:
+        return jsonify({"error": "Print job not found."}), 404
+    return jsonify(job.to_dict())
+
+
+@bp.route('/api/printers', methods=['GET'])
+def list_printers():
+    """
+    The label printers as last reported by the print worker: healthy or not,
+    status, labels in flight and error count.
+    """
+    printers = PrinterStatus.query.order_by(PrinterStatus.name).all()
+    return jsonify([printer.to_dict() for printer in printers])
+
+
+@bp.route('/')
+def serve_index():
+    return get_assets().page('index.html')
@@ -0,0 +1,54 @@
+"""
+Printed labels, kept as brother_ql raster instructions in a size-bounded
+disk cache (the app's, in LABEL_CACHE_DIR, shared by print_worker.py and
+the kiosk app) so a reprint or a spare copy skips composing the badge and
+convert() (thresholding and red/black separation) altogether.
+
+Each visitor's label is converted on its own, on its first print, and
+cached under the visitor id, the badge fingerprint (see Visitor.pdf_key)
+and the badge layout version; a corrected row or a new layout gets a new
+entry. A run of labels is the cached instructions one after the other:
+each is a complete print job, so the printer takes them in one session.
+"""
+import hashlib
+import re
+
+from badge import layout_version, raster_instructions
+
+from .extensions import get_label_cache
+from .rendering import render_visitor_badge
+
+LABEL_CACHE_BYTES = 100 * 1024 * 1024  # a badge label is about 130 KB
+
+LABEL_NAME = re.compile(r"label-(\d+)-[0-9a-f]{12}-[0-9a-f]{8}\.bin")
+
+
+def label_key(visitor):
+    layout = hashlib.sha1(layout_version().encode()).hexdigest()[:8]
+    return f"label-{visitor.id}-{visitor.badge_fingerprint}-{layout}.bin"
+
+
+def label_visitor_id(key):
+    """Visitor id of a cached label's key, or None for other names."""
+    match = LABEL_NAME.fullmatch(key)
+    return int(match.group(1)) if match else None
+
+
+def get_label_raster(visitor, storage, badge=None):
+    """
+    Raster instructions for one label of the visitor's badge. On a miss the
+    badge is composed from the row, unless the caller already has it.
+    """
+    def create():
+        return raster_instructions([badge or render_visitor_badge(visitor, storage)])
+
+    cache = get_label_cache()
+    key = label_key(visitor)
+    try:
+        with open(cache.get_or_create(key, create), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        # Evicted by another process between the lookup and the read
+        data = create()
+        cache.put(key, data)
+        return data
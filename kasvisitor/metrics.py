@@ -0,0 +1,218 @@
+"""
+Request timing and counters, served in the Prometheus text format on
+/metrics by every role of the app.
+
+Each request gets an id, the proxy's X-Request-ID if it set one, which is
+echoed in the response and carried on every log line written while
+handling it (logfmt, on the "kasvisitor" logger; REQUEST_LOG=0 turns off the
+one line per request). /submit times its stages with stage(); badge PDF
+renders and the print worker record their own histograms and counters.
+Recording a value costs a lock, a bisect and an increment, so this stays on
+in production.
+
+Values are kept per process. With several gunicorn worker processes each
+reports its own numbers, so prefer threads (--threads) for these apps.
+"""
+import bisect
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, current_app, g, has_request_context, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PRINT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger("kasvisitor")
+
+_metrics = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {} if self.labelnames else {(): 0}
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Observed durations (seconds) in cumulative buckets, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> [per-bucket counts (+Inf last), sum]
+        if not self.labelnames:
+            self._values[()] = [[0] * (len(self.buckets) + 1), 0.0]
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+request_seconds = Histogram(
+    "kas_http_request_duration_seconds", "Time to handle a request (until the body starts streaming).",
+    ("method", "endpoint", "status"))
+submit_stage_seconds = Histogram(
+    "kas_submit_stage_seconds", "Time spent in each stage of /submit.", ("stage",))
+badge_photo_errors = Counter(
+    "kas_badge_photo_errors_total", "Badges composed without the visitor's photo because it couldn't be decoded.")
+render_pool_busy = Counter(
+    "kas_render_pool_busy_total", "Registrations turned away with 503 because the render pool was full.")
+badge_pdf_render_seconds = Histogram(
+    "kas_badge_pdf_render_seconds", "Time to render a badge PDF that wasn't cached.")
+print_run_seconds = Histogram(
+    "kas_print_run_seconds", "Time to send one run of labels to the printer.",
+    buckets=PRINT_BUCKETS)
+labels_printed = Counter(
+    "kas_print_labels_total", "Labels sent to the printer.")
+print_failures = Counter(
+    "kas_print_failures_total", "Failed print job attempts, by the step that failed (render or print).",
+    ("step",))
+retention_actions = Counter(
+    "kas_retention_total", "Photos archived, PDFs deleted and rows deleted by the retention job.", ("action",))
+printer_errors = Counter(
+    "kas_printer_errors_total", "Failed runs and error status replies, by printer.", ("printer",))
+
+
+def render_metrics():
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def stage(name, stage_ms=None):
+    """
+    Time one stage of /submit, for the histogram and the request's log line
+    (g.stage_ms, or the 'stage_ms' dict outside of a request context).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        submit_stage_seconds.observe(elapsed, stage=name)
+        if stage_ms is None:
+            stage_ms = g.setdefault("stage_ms", {})
+        stage_ms[name] = round(elapsed * 1000, 1)
+
+
+def _logfmt(value):
+    value = str(value)
+    if not value or any(c in value for c in ' ="\\'):
+        value = '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return value
+
+
+def log(event, level=logging.INFO, **fields):
+    """One logfmt line on the "kasvisitor" logger, tagged with the request id."""
+    if not logger.isEnabledFor(level):
+        return
+    if has_request_context() and "request_id" in g:
+        fields = {"request_id": g.request_id, **fields}
+    logger.log(level, " ".join(f"{key}={_logfmt(value)}" for key, value in {"event": event, **fields}.items()))
+
+
+def _start_request():
+    g.request_id = request.headers.get("X-Request-ID", "")[:64] or uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+
+
+def _finish_request(response):
+    if "request_start" not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    request_seconds.observe(elapsed, method=request.method, endpoint=endpoint, status=response.status_code)
+    response.headers["X-Request-ID"] = g.request_id
+    if current_app.config["REQUEST_LOG"] and request.endpoint != "metrics":
+        log("request", method=request.method, path=request.path, status=response.status_code,
+            duration_ms=round(elapsed * 1000, 1), **g.get("stage_ms", {}))
+    return response
+
+
+def metrics_endpoint():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    """Time every request, log it if REQUEST_LOG is set, and serve /metrics."""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint)
@@ -0,0 +1,167 @@
+import hashlib
+from datetime import date, datetime, timezone
+
+from .extensions import db
+
+
+# === Database Model for Visitor ===
+class Visitor(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    first_name = db.Column(db.String(100), nullable=False)
+    last_name  = db.Column(db.String(100), nullable=False)
+    email      = db.Column(db.String(150), nullable=False, index=True)
+    phone      = db.Column(db.String(20), nullable=False, index=True)
+    purpose    = db.Column(db.String(100), nullable=False)
+    finding    = db.Column(db.String(100), nullable=False)
+    photo_path = db.Column(db.String(200), index=True)  # None for pre-registered visitors checked in without one
+    photo_archive = db.Column(db.String(300))  # <archive zip key>/<photo key> once retention archived the photo
+    pdf_path   = db.Column(db.String(200))  # only set on rows whose PDF was written eagerly
+    idempotency_key = db.Column(db.String(64))  # the kiosk's Idempotency-Key for the /submit that created it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Newest-first listing and keyset pagination on (created_at, id)
+        db.Index('ix_visitor_created_at_id', 'created_at', 'id'),
+        db.Index('ix_visitor_name', 'last_name', 'first_name'),
+        # A retried registration finds its visit rather than adding a second one
+        db.Index('ix_visitor_idempotency_key', 'idempotency_key', unique=True),
+    )
+
+    @property
+    def visit_date(self):
+        """Local date and time of the visit (created_at is stored in UTC)."""
+        return self.created_at.replace(tzinfo=timezone.utc).astimezone()
+
+    @property
+    def badge_fingerprint(self):
+        """Hash of what is printed on the badge, for the names of cached renders."""
+        printed = "|".join([self.first_name, self.last_name, self.purpose, self.finding,
+                            self.photo_path or "", self.visit_date.strftime("%Y-%m-%d")])
+        return hashlib.sha1(printed.encode()).hexdigest()[:12]
+
+    @property
+    def pdf_key(self):
+        """
+        Key under /pdfs/ of this visitor's badge PDF. Badges are rendered on
+        first download (see pdfs.py); the name includes a fingerprint of what
+        is printed on the badge, so a corrected row gets a new PDF.
+        """
+        if self.pdf_path:
+            return self.pdf_path
+        return f"pdfs/badge-{self.id}-{self.badge_fingerprint}.pdf"
+
+
+# === Pre-registered visitors ===
+# Guest lists imported ahead of an event. Badges are rendered in the
+# background after the import (badge_path); checking in creates the Visitor
+# row and queues the pre-rendered badge for printing.
+class Registration(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    first_name  = db.Column(db.String(100), nullable=False)
+    last_name   = db.Column(db.String(100), nullable=False)
+    email       = db.Column(db.String(150), nullable=False, default='', index=True)
+    phone       = db.Column(db.String(20), nullable=False, default='', index=True)
+    purpose     = db.Column(db.String(100), nullable=False, default='')
+    finding     = db.Column(db.String(100), nullable=False, default='')
+    expected_on = db.Column(db.Date)
+    badge_path  = db.Column(db.String(200))
+    visitor_id  = db.Column(db.Integer, db.ForeignKey('visitor.id'))  # set on check-in
+    created_at  = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def badge_date(self):
+        """Date printed on the badge: the expected day, else the import day."""
+        if self.expected_on:
+            return self.expected_on
+        return (self.created_at or datetime.utcnow()).replace(tzinfo=timezone.utc).astimezone().date()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "email": self.email,
+            "phone": self.phone,
+            "purpose": self.purpose,
+            "finding": self.finding,
+            "expected_on": self.expected_on.isoformat() if self.expected_on else None,
+            "badge_ready": self.badge_path is not None and self.badge_date == date.today(),
+            "visitor_id": self.visitor_id
+        }
+
+
+# === Print queue ===
+# Labels are printed by a single worker that owns the USB printer, so /submit
+# only has to add a row here and can return straight away.
+class PrintJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    visitor_id = db.Column(db.Integer, db.ForeignKey('visitor.id'), nullable=False)
+    status     = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued/printing/done/failed
+    copies     = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    attempts   = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500))
+    printer    = db.Column(db.String(50))  # name of the printer that printed it
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    visitor = db.relationship('Visitor')
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "visitor_id": self.visitor_id,
+            "status": self.status,
+            "copies": self.copies,
+            "attempts": self.attempts,
+            "retries": max(self.attempts - 1, 0),
+            "last_error": self.last_error,
+            "printer": self.printer,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat()
+        }
+
+
+# === Label printers ===
+# Written by the print worker (see printers.py) whenever a printer's state
+# changes, so every process can show it.
+class PrinterStatus(db.Model):
+    name           = db.Column(db.String(50), primary_key=True)
+    identifier     = db.Column(db.String(200), nullable=False)
+    backend        = db.Column(db.String(20), nullable=False)
+    healthy        = db.Column(db.Boolean, nullable=False, default=True)
+    status         = db.Column(db.String(500), nullable=False, default='unknown')
+    queued_labels  = db.Column(db.Integer, nullable=False, default=0)
+    labels_printed = db.Column(db.Integer, nullable=False, default=0)  # since the worker started
+    error_count    = db.Column(db.Integer, nullable=False, default=0)  # since the worker started
+    last_error     = db.Column(db.String(500))
+    checked_at     = db.Column(db.DateTime)
+    updated_at     = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "identifier": self.identifier,
+            "backend": self.backend,
+            "healthy": self.healthy,
+            "status": self.status,
+            "queued_labels": self.queued_labels,
+            "labels_printed": self.labels_printed,
+            "error_count": self.error_count,
+            "last_error": self.last_error,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+# === Visitor statistics ===
+# Visits per hour (UTC hour, like created_at) and per day (local date, like
+# the badges), in total and by purpose and by host. Every new visit adds to
+# them in its own transaction (see stats.py); the retention purge leaves
+# them alone, so they keep the history of deleted visits.
+class VisitRollup(db.Model):
+    period    = db.Column(db.String(4), primary_key=True)    # 'hour' or 'day'
+    dimension = db.Column(db.String(10), primary_key=True)   # 'total', 'purpose' or 'finding'
+    start     = db.Column(db.DateTime, primary_key=True)     # hour start (UTC) or local midnight
+    value     = db.Column(db.String(100), primary_key=True)  # the purpose or host; '' for totals
+    visits    = db.Column(db.Integer, nullable=False, default=0)
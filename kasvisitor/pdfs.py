@@ -0,0 +1,39 @@
+"""
+Badge PDFs, rendered on first download instead of at registration.
+
+Most badges are never downloaded, so /submit no longer writes a PDF. When
+/pdfs/badge-<id>-<fingerprint>.pdf is requested, the badge is composed
+from the Visitor row and its photo and the PDF is kept in a size-bounded
+disk cache (the app's, in PDF_CACHE_DIR); an evicted PDF is simply
+rendered again. Rows registered
+before this keep their eagerly written PDF in storage (Visitor.pdf_path).
+"""
+import io
+import re
+
+from .extensions import get_pdf_cache
+from .metrics import badge_pdf_render_seconds
+from .rendering import render_visitor_badge
+
+PDF_CACHE_BYTES = 200 * 1024 * 1024
+
+BADGE_PDF_NAME = re.compile(r"badge-(\d+)-[0-9a-f]{12}\.pdf")
+
+
+def badge_pdf_visitor_id(filename):
+    """Visitor id of a lazily rendered badge PDF name, or None for other names."""
+    match = BADGE_PDF_NAME.fullmatch(filename)
+    return int(match.group(1)) if match else None
+
+
+def get_badge_pdf(visitor, storage):
+    """Path of the cached badge PDF for a visitor, rendering it on a miss."""
+    key = visitor.pdf_key.split("/", 1)[1]
+
+    def create():
+        with badge_pdf_render_seconds.time():
+            pdf = io.BytesIO()
+            render_visitor_badge(visitor, storage).write_pdf(pdf)
+            return pdf.getvalue()
+
+    return get_pdf_cache().get_or_create(key, create)
@@ -0,0 +1,272 @@
+"""
+The label printers: a registry built from the PRINTERS setting, status
+polling, and the choice of printer for each run of labels.
+
+PRINTERS is a comma-separated list of name=identifier entries, e.g.
+
+    PRINTERS="north=usb://0x04f9:0x209b,south=tcp://10.0.4.21,desk=file:///dev/usb/lp0"
+
+The brother_ql backend follows from the identifier (usb:// pyusb, tcp://
+network, file:// or /dev/usb/ linux_kernel); sim://<name> is an in-memory
+SimulatedPrinter for tests and benchmarks.
+
+Each run goes to the healthy printer with the fewest labels in flight and
+moves on to the next one if sending fails. A printer that fails, or whose
+status reply reports an error (out of tape, cover open, ...), is left out
+until a later status poll finds it ready again. The print worker polls
+every PRINTER_STATUS_INTERVAL seconds and keeps the printer_status table up
+to date, so /api/printers works from any process.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+from brother_ql.backends import backend_factory, guess_backend
+from brother_ql.reader import interpret_response
+
+from .extensions import db
+from .metrics import log, printer_errors
+from .models import PrinterStatus
+
+PRINTER_STATUS_TIMEOUT = 10  # seconds to wait for the printer to report back
+
+# Invalidate, initialize, status information request (Brother QL command reference)
+STATUS_REQUEST = b"\x00" * 200 + b"\x1b\x40" + b"\x1b\x69\x53"
+
+
+class PrinterError(Exception):
+    pass
+
+
+class Printer:
+    """One label printer and what the worker knows about it."""
+
+    def __init__(self, name, identifier, backend=None):
+        self.name = name
+        self.identifier = identifier
+        self.backend = backend or guess_backend(identifier)
+        self.healthy = True     # until a status poll or a failed run says otherwise
+        self.status = "unknown"
+        self.queued_labels = 0  # labels handed to this printer and not done yet
+        self.labels_printed = 0
+        self.error_count = 0
+        self.last_error = None
+        self.checked_at = None
+        # Held while talking to the printer, so polls don't interleave with a run
+        self.lock = threading.Lock()
+
+    def _open(self):
+        return backend_factory(self.backend)["backend_class"](self.identifier)
+
+    def _read_reply(self, device):
+        """The next status reply, or raise PrinterError if none arrives in time."""
+        deadline = time.monotonic() + PRINTER_STATUS_TIMEOUT
+        while time.monotonic() < deadline:
+            data = device.read()
+            if not data:
+                time.sleep(0.01)
+                continue
+            try:
+                return interpret_response(data)
+            except (AssertionError, ValueError):
+                continue  # not a status reply
+        raise PrinterError("no status reply")
+
+    def write(self, instructions):
+        """
+        Send raster instructions and wait until the printer reports the first
+        label printed. Raises PrinterError if it reports errors instead. The
+        network backend can't read replies, so there only the send is checked.
+        """
+        device = self._open()
+        try:
+            device.write(instructions)
+            if self.backend == "network":
+                return
+            while True:
+                reply = self._read_reply(device)
+                if reply["errors"]:
+                    raise PrinterError(", ".join(reply["errors"]))
+                if reply["status_type"] == "Printing completed":
+                    return
+        finally:
+            device.dispose()
+
+    def read_status(self):
+        """The errors the printer reports (empty when it is ready)."""
+        device = self._open()
+        try:
+            if self.backend == "network":
+                return []  # connecting is all that can be checked
+            device.write(STATUS_REQUEST)
+            return self._read_reply(device)["errors"]
+        finally:
+            device.dispose()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "identifier": self.identifier,
+            "backend": self.backend,
+            "healthy": self.healthy,
+            "status": self.status,
+            "queued_labels": self.queued_labels,
+            "labels_printed": self.labels_printed,
+            "error_count": self.error_count,
+            "last_error": self.last_error,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+        }
+
+
+class SimulatedPrinter(Printer):
+    """
+    A printer that only exists in memory. Sending sleeps for a session
+    setup cost plus the transfer time at usb_kbps; put error strings in
+    'faults' (e.g. ["No media when printing"]) to make it fail.
+    """
+
+    def __init__(self, name, identifier=None, session_ms=0, usb_kbps=float("inf")):
+        super().__init__(name, identifier or f"sim://{name}", backend="simulated")
+        self.session_ms = session_ms
+        self.usb_kbps = usb_kbps
+        self.faults = []
+        self.sessions = 0
+        self.bytes_sent = 0
+
+    def write(self, instructions):
+        time.sleep(self.session_ms / 1000 + len(instructions) / (self.usb_kbps * 1000))
+        if self.faults:
+            raise PrinterError(", ".join(self.faults))
+        self.sessions += 1
+        self.bytes_sent += len(instructions)
+
+    def read_status(self):
+        return list(self.faults)
+
+
+def printer_from_spec(name, identifier):
+    if identifier.startswith("sim://"):
+        return SimulatedPrinter(name, identifier)
+    return Printer(name, identifier)
+
+
+class PrinterRegistry:
+    """The configured printers, in order of preference when equally loaded."""
+
+    def __init__(self, printers):
+        names = [printer.name for printer in printers]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Printer names must be unique: {', '.join(names)}")
+        self.printers = list(printers)
+        self.version = 0  # bumped on every change, so the worker knows when to save
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, spec):
+        """Parse a PRINTERS setting; entries without a name are called printer1, printer2, ..."""
+        printers = []
+        for number, entry in enumerate(filter(None, (e.strip() for e in spec.split(","))), 1):
+            name, sep, identifier = entry.partition("=")
+            if not sep:
+                name, identifier = "", entry
+            printers.append(printer_from_spec(name.strip() or f"printer{number}", identifier.strip()))
+        if not printers:
+            raise ValueError("PRINTERS names no printer")
+        return cls(printers)
+
+    def __len__(self):
+        return len(self.printers)
+
+    def __iter__(self):
+        return iter(self.printers)
+
+    def available(self):
+        return any(printer.healthy for printer in self.printers)
+
+    def _acquire(self, labels, exclude):
+        with self._lock:
+            candidates = [p for p in self.printers if p.healthy and p not in exclude]
+            if not candidates:
+                return None
+            printer = min(candidates, key=lambda p: p.queued_labels)
+            printer.queued_labels += labels
+            self.version += 1
+            return printer
+
+    def _release(self, printer, labels, error=None):
+        with self._lock:
+            printer.queued_labels -= labels
+            if error is None:
+                printer.labels_printed += labels
+                printer.status = "ready"
+            else:
+                printer.healthy = False
+                printer.status = printer.last_error = str(error)[:500]
+                printer.error_count += 1
+            self.version += 1
+        if error is not None:
+            printer_errors.inc(printer=printer.name)
+
+    def send(self, instructions, labels):
+        """
+        Print on the least loaded healthy printer, failing over to the others.
+        Returns the printer used; raises PrinterError if none could print.
+        """
+        tried = []
+        while True:
+            printer = self._acquire(labels, tried)
+            if printer is None:
+                last = tried[-1].last_error if tried else "no healthy printer"
+                raise PrinterError(f"No printer could print ({last})")
+            tried.append(printer)
+            try:
+                with printer.lock:
+                    printer.write(instructions)
+            except Exception as e:
+                self._release(printer, labels, e)
+                log("printer_failed", logging.WARNING, printer=printer.name, labels=labels, error=e)
+                continue
+            self._release(printer, labels)
+            return printer
+
+    def poll(self):
+        """Ask every idle printer for its status and mark it healthy or not."""
+        for printer in self.printers:
+            if not printer.lock.acquire(blocking=False):
+                continue  # printing right now; the run reports its own errors
+            try:
+                errors = printer.read_status()
+            except Exception as e:
+                errors = [str(e) or type(e).__name__]
+            finally:
+                printer.lock.release()
+            with self._lock:
+                was_healthy = printer.healthy
+                printer.healthy = not errors
+                printer.status = ", ".join(errors)[:500] if errors else "ready"
+                printer.checked_at = datetime.utcnow()
+                if errors and was_healthy:
+                    printer.last_error = printer.status
+                    printer.error_count += 1
+                self.version += 1
+            if errors and was_healthy:
+                printer_errors.inc(printer=printer.name)
+                log("printer_unavailable", logging.WARNING, printer=printer.name, status=printer.status)
+            elif not errors and not was_healthy:
+                log("printer_ready", printer=printer.name)
+
+    def status(self):
+        with self._lock:
+            return [printer.to_dict() for printer in self.printers]
+
+
+def save_printer_status(registry):
+    """Write the registry's state to printer_status (and forget printers no longer configured)."""
+    for state in registry.status():
+        if state["checked_at"]:
+            state["checked_at"] = datetime.fromisoformat(state["checked_at"])
+        db.session.merge(PrinterStatus(**state))
+    PrinterStatus.query.filter(PrinterStatus.name.notin_([p.name for p in registry])).delete(
+        synchronize_session=False)
+    db.session.commit()
@@ -0,0 +1,197 @@
+"""
+Label printing: the print queue worker and the Brother QL-800 output.
+
+The worker takes every due job at once (up to PRINT_BATCH_MAX_LABELS
+labels) and prints them as one run with a cut between labels and one
+send(), so a group arriving together only pays the USB session and printer
+setup once. Each label's raster instructions come from the label cache
+(see labels.py), so reprints and extra copies are only a USB transfer.
+
+With several printers configured (see printers.py) the worker runs one
+print loop per printer, each sending its run to the least loaded healthy
+printer, and polls the printers' status in between. While no printer is
+healthy, jobs stay in the queue.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .extensions import db, get_printers, get_storage
+from .labels import get_label_raster
+from .metrics import labels_printed, log, print_failures, print_run_seconds
+from .models import PrintJob
+from .printers import save_printer_status
+
+PRINT_MAX_ATTEMPTS = 3
+PRINT_RETRY_DELAY = 10      # seconds before a failed job is tried again
+PRINT_POLL_INTERVAL = 1.0   # seconds the worker sleeps when the queue is empty
+PRINT_BATCH_MAX_LABELS = 50  # labels sent to the printer in one session
+PRINT_MAX_COPIES = 50       # copies of one badge per job
+
+# Badges composed by /submit, handed to an in-process print worker so it
+# doesn't have to decode the photo and lay the badge out a second time.
+# A worker in another process re-renders from the Visitor row instead.
+_print_worker_thread = None
+_composed_badges = {}
+
+
+def print_worker_running():
+    return _print_worker_thread is not None
+
+
+def hand_off_badge(job_id, badge):
+    """Give an already composed badge to the in-process worker, if there is one."""
+    if badge is not None and _print_worker_thread is not None:
+        _composed_badges[job_id] = badge
+
+
+def print_labels(instructions, labels):
+    """
+    Sends raster instructions for 'labels' labels in a single printer
+    session. Returns the name of the printer used; raises PrinterError if
+    no printer could print them.
+    """
+    with print_run_seconds.time():
+        printer = get_printers().send(instructions, labels)
+    labels_printed.inc(labels)
+    log("labels_printed", labels=labels, printer=printer.name)
+    return printer.name
+
+
+def _job_failed(job, error):
+    """Record a failed attempt; re-queue the job until PRINT_MAX_ATTEMPTS."""
+    job.last_error = str(error)[:500]
+    if job.attempts >= PRINT_MAX_ATTEMPTS:
+        job.status = 'failed'
+    else:
+        job.status = 'queued'
+        job.next_attempt_at = datetime.utcnow() + timedelta(seconds=PRINT_RETRY_DELAY)
+
+
+def process_print_jobs():
+    """
+    Print all jobs that are due, oldest first, in one run of labels.
+    Returns the number of jobs taken (0 if there was nothing to do).
+    Failed jobs are re-queued until PRINT_MAX_ATTEMPTS is reached. Nothing
+    is taken while no printer is healthy.
+    """
+    if not get_printers().available():
+        return 0
+    due = (PrintJob.query
+           .filter(PrintJob.status == 'queued', PrintJob.next_attempt_at <= datetime.utcnow())
+           .order_by(PrintJob.id)
+           .limit(PRINT_BATCH_MAX_LABELS)
+           .all())
+    batch = []
+    labels = 0
+    for job in due:
+        if batch and labels + job.copies > PRINT_BATCH_MAX_LABELS:
+            break
+        batch.append(job)
+        labels += job.copies
+    if not batch:
+        return 0
+
+    # Claim the jobs; another print loop may have taken some of them already
+    claimed = []
+    for job in batch:
+        if (PrintJob.query.filter_by(id=job.id, status='queued')
+                .update({'status': 'printing', 'attempts': PrintJob.attempts + 1},
+                        synchronize_session=False)):
+            claimed.append(job)
+    db.session.commit()
+    batch = claimed
+    if not batch:
+        return 0
+
+    # A badge that can't be rendered fails its own job, not the whole run
+    printable = []
+    run = []
+    for job in batch:
+        try:
+            raster = get_label_raster(job.visitor, get_storage(), _composed_badges.pop(job.id, None))
+        except Exception as e:
+            log("print_render_failed", logging.ERROR, job_id=job.id, error=e)
+            print_failures.inc(step="render")
+            _job_failed(job, e)
+            continue
+        printable.append(job)
+        run.append(raster * job.copies)
+
+    if printable:
+        try:
+            printer = print_labels(b"".join(run), sum(job.copies for job in printable))
+        except Exception as e:
+            log("print_failed", logging.ERROR, jobs=len(printable), error=e)
+            print_failures.inc(len(printable), step="print")
+            for job in printable:
+                _job_failed(job, e)
+        else:
+            for job in printable:
+                job.status = 'done'
+                job.printer = printer
+                job.last_error = None
+    db.session.commit()
+    return len(batch)
+
+
+def _print_loop(app, stop_event):
+    with app.app_context():
+        while not stop_event.is_set():
+            try:
+                busy = process_print_jobs()
+            except Exception as e:
+                log("print_worker_error", logging.ERROR, error=e)
+                db.session.rollback()
+                busy = 0
+            if not busy:
+                stop_event.wait(PRINT_POLL_INTERVAL)
+        db.session.remove()
+
+
+def run_print_worker(app, stop_event=None):
+    """
+    Work through the print queue until stop_event is set (or forever), with
+    one print loop per configured printer, and keep the printer status up
+    to date. Only one worker should run per set of printers.
+    """
+    stop_event = stop_event or threading.Event()
+    with app.app_context():
+        # Jobs left in 'printing' by a worker that died mid-job go back in the queue
+        PrintJob.query.filter_by(status='printing').update({'status': 'queued'})
+        db.session.commit()
+
+        printers = get_printers()
+        interval = app.config["PRINTER_STATUS_INTERVAL"]
+        printers.poll()
+        loops = [threading.Thread(target=_print_loop, args=(app, stop_event),
+                                  name=f"print-loop-{i}", daemon=True)
+                 for i in range(len(printers))]
+        for loop in loops:
+            loop.start()
+
+        last_poll = time.monotonic()
+        saved = None
+        while not stop_event.is_set():
+            if time.monotonic() - last_poll >= interval:
+                printers.poll()
+                last_poll = time.monotonic()
+            if printers.version != saved:
+                saved = printers.version
+                try:
+                    save_printer_status(printers)
+                except Exception as e:
+                    log("printer_status_save_failed", logging.ERROR, error=e)
+                    db.session.rollback()
+            stop_event.wait(PRINT_POLL_INTERVAL)
+        for loop in loops:
+            loop.join()
+
+
+def start_print_worker(app):
+    global _print_worker_thread
+    _print_worker_thread = threading.Thread(target=run_print_worker, args=(app,),
+                                            name="print-worker", daemon=True)
+    _print_worker_thread.start()
+    return _print_worker_thread
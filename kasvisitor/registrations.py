@@ -0,0 +1,191 @@
+"""
+Pre-registration: guest lists imported ahead of an event, and badges for
+them rendered in the background so checking in at the door is a lookup
+plus a print.
+
+Imports are inserted REGISTRATION_IMPORT_CHUNK_SIZE rows per executemany
+INSERT and transaction, instead of one ORM add and commit per visitor.
+Afterwards a single background thread renders the badges that are still
+missing, PRERENDER_BATCH_SIZE per commit, and stores them as PNGs in the
+"badges" storage namespace.
+"""
+import csv
+import io
+import json
+import logging
+import threading
+from datetime import date
+from itertools import islice
+
+from PIL import Image
+
+from badge import Badge, compose_badge
+
+from .extensions import db, get_storage
+from .metrics import log
+from .models import Registration
+
+REGISTRATION_IMPORT_CHUNK_SIZE = 1000
+REGISTRATION_IMPORT_MAX_ERRORS = 100  # rejected rows reported back per import
+PRERENDER_BATCH_SIZE = 50
+
+REGISTRATION_FIELDS = ("first_name", "last_name", "email", "phone", "purpose", "finding", "expected_on")
+
+_prerender_lock = threading.Lock()
+_prerender_wanted = threading.Event()
+_prerender_thread = None
+
+
+class InvalidImport(ValueError):
+    pass
+
+
+def read_import_rows(stream, fmt):
+    """
+    Raw rows (dicts) of a guest list: CSV with a header row, or JSON (a list
+    of objects, or an object with a "visitors" list). 'stream' is binary.
+    """
+    if fmt == "csv":
+        return csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    try:
+        data = json.load(stream)
+    except ValueError:
+        raise InvalidImport("Body is not valid JSON.")
+    if isinstance(data, dict):
+        data = data.get("visitors")
+    if not isinstance(data, list):
+        raise InvalidImport("Expected a list of visitors.")
+    return data
+
+
+def clean_row(raw):
+    """Column values for one Registration; raises ValueError if unusable."""
+    if not isinstance(raw, dict):
+        raise ValueError("not an object")
+    row = {}
+    for field in REGISTRATION_FIELDS:
+        value = raw.get(field)
+        row[field] = str(value).strip() if value is not None else ""
+        length = Registration.__table__.c[field].type.length if field != "expected_on" else None
+        if length and len(row[field]) > length:
+            raise ValueError(f"{field} is longer than {length} characters")
+    if not row["first_name"] or not row["last_name"]:
+        raise ValueError("first_name and last_name are required")
+    if not row["phone"] and not row["email"]:
+        raise ValueError("phone or email is required")
+    row["expected_on"] = date.fromisoformat(row["expected_on"]) if row["expected_on"] else None
+    return row
+
+
+def import_registrations(raw_rows):
+    """
+    Insert the usable rows, one transaction per chunk. Returns (imported,
+    rejected, errors), errors being the first few rejected rows (numbered
+    from 1) with the reason. Input that can't be read at all raises
+    InvalidImport; the chunks before it stay imported.
+    """
+    imported = rejected = 0
+    errors = []
+    numbered = enumerate(raw_rows, 1)
+    while True:
+        try:
+            batch = list(islice(numbered, REGISTRATION_IMPORT_CHUNK_SIZE))
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise InvalidImport(f"Unreadable input after {imported} imported rows: {e}")
+        if not batch:
+            break
+        rows = []
+        for number, raw in batch:
+            try:
+                rows.append(clean_row(raw))
+            except ValueError as e:
+                rejected += 1
+                if len(errors) < REGISTRATION_IMPORT_MAX_ERRORS:
+                    errors.append({"row": number, "error": str(e)})
+        if rows:
+            db.session.execute(Registration.__table__.insert(), rows)
+            db.session.commit()
+            imported += len(rows)
+    return imported, rejected, errors
+
+
+def prerender_badges(limit=PRERENDER_BATCH_SIZE):
+    """
+    Render and store badges for up to 'limit' registrations that haven't
+    checked in and have none yet. Returns how many were rendered.
+    """
+    registrations = (Registration.query
+                     .filter(Registration.badge_path.is_(None), Registration.visitor_id.is_(None))
+                     .order_by(Registration.id)
+                     .limit(limit)
+                     .all())
+    storage = get_storage()
+    for registration in registrations:
+        badge = compose_badge(registration.first_name, registration.last_name, registration.purpose,
+                              registration.finding, None, registration.badge_date)
+        png = io.BytesIO()
+        badge.image.save(png, "PNG", compress_level=1)
+        registration.badge_path = storage.put("badges", png.getvalue(), ".png")
+    db.session.commit()
+    return len(registrations)
+
+
+def _run_prerender(app):
+    global _prerender_thread
+    with app.app_context():
+        while True:
+            _prerender_wanted.clear()
+            try:
+                while prerender_badges():
+                    pass
+            except Exception as e:
+                log("badge_prerender_failed", logging.ERROR, error=e)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+            with _prerender_lock:
+                # Another import may have asked for more while this batch ran
+                if not _prerender_wanted.is_set():
+                    _prerender_thread = None
+                    return
+
+
+def start_badge_prerender(app):
+    """Render missing badges in a background thread (one at a time per process)."""
+    global _prerender_thread
+    with _prerender_lock:
+        _prerender_wanted.set()
+        if _prerender_thread is None:
+            _prerender_thread = threading.Thread(target=_run_prerender, args=(app,),
+                                                 name="badge-prerender", daemon=True)
+            _prerender_thread.start()
+        return _prerender_thread
+
+
+def stored_badge(registration, storage):
+    """The pre-rendered badge of 'registration', or None if there is none or it can't be read."""
+    if not registration.badge_path:
+        return None
+    try:
+        with storage.open(registration.badge_path) as png:
+            return Badge(Image.open(png).convert("RGB"))
+    except OSError as e:
+        log("prerendered_badge_unreadable", logging.WARNING, registration_id=registration.id, error=e)
+        return None
+
+
+def checked_in_badge(visitor, storage):
+    """
+    The pre-rendered badge of the registration 'visitor' checked in with,
+    if it is exactly the badge the visitor row would compose (same text,
+    same date, no photo); None otherwise.
+    """
+    if visitor.photo_path is not None:
+        return None
+    registration = Registration.query.filter_by(visitor_id=visitor.id).first()
+    if registration is None or registration.badge_date != visitor.visit_date.date():
+        return None
+    printed = (visitor.first_name, visitor.last_name, visitor.purpose, visitor.finding)
+    if printed != (registration.first_name, registration.last_name, registration.purpose, registration.finding):
+        return None
+    return stored_badge(registration, storage)
@@ -0,0 +1,172 @@
+"""
+Badge rendering: re-encoding the photo at registration, composing badges
+for the printer and for the PDFs rendered on download.
+
+Registration work is CPU-bound and, on the request thread, holds the GIL, so
+kiosks submitting at the same time queue up behind each other. With
+RENDER_WORKERS > 0 it runs in a pool of worker processes instead, each
+started with the font and logo already loaded. At most RENDER_WORKERS +
+RENDER_QUEUE_DEPTH registrations are accepted at once; beyond that
+render() raises RenderPoolBusy and the kiosk is told to retry (503).
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from badge import INFO_FONT_SIZE, NAME_FONT_SIZE, assets, compose_badge
+
+from .metrics import badge_photo_errors, log
+from .registrations import checked_in_badge
+
+# Every uploaded photo is re-encoded to a JPEG no larger than PHOTO_MAX_SIZE
+# (the upload itself is capped by MAX_CONTENT_LENGTH).
+PHOTO_MAX_SIZE = (800, 800)
+PHOTO_MAX_PIXELS = 40_000_000
+PHOTO_JPEG_QUALITY = 85
+
+
+class InvalidPhoto(ValueError):
+    pass
+
+
+class RenderPoolBusy(Exception):
+    """Every render slot is taken (or the pool is restarting); retry later."""
+
+
+def encode_photo(photo_file):
+    """
+    Re-encode an uploaded photo as a JPEG of at most PHOTO_MAX_SIZE.
+    'photo_file' is a binary file object (an upload stream or a BytesIO).
+    Returns (JPEG bytes, decoded image) so the badge doesn't decode it
+    again; raises InvalidPhoto if the data isn't a usable image.
+    """
+    try:
+        with Image.open(photo_file) as photo:
+            if photo.width * photo.height > PHOTO_MAX_PIXELS:
+                raise InvalidPhoto("Photo resolution is too large.")
+            photo.draft('RGB', PHOTO_MAX_SIZE)
+            photo = photo.convert('RGB')
+    except (OSError, Image.DecompressionBombError):
+        raise InvalidPhoto("Photo is not a readable image.")
+    photo.thumbnail(PHOTO_MAX_SIZE, Image.LANCZOS)
+
+    jpeg = io.BytesIO()
+    photo.save(jpeg, "JPEG", quality=PHOTO_JPEG_QUALITY)
+    return jpeg.getvalue(), photo
+
+
+def render_registration(first_name, last_name, purpose, finding, photo_file, keep_badge=False):
+    """
+    Everything /submit draws for one visitor: the re-encoded photo and, if
+    keep_badge is set, the composed badge to hand to the printer.
+    Returns (photo JPEG bytes, Badge or None).
+    """
+    photo_jpeg, photo = encode_photo(photo_file)
+    if not keep_badge:
+        return photo_jpeg, None
+    return photo_jpeg, _counted(compose_badge(first_name, last_name, purpose, finding, photo))
+
+
+def _counted(badge):
+    if badge.photo_failed:
+        badge_photo_errors.inc()
+    return badge
+
+
+def render_visitor_badge(visitor, storage):
+    """
+    Compose the badge for a stored Visitor row, or load the one pre-rendered
+    for the guest list registration it checked in with.
+    """
+    badge = checked_in_badge(visitor, storage)
+    if badge is not None:
+        return badge
+    if visitor.photo_path is None:
+        return compose_badge(visitor.first_name, visitor.last_name, visitor.purpose,
+                             visitor.finding, None, visitor.visit_date)
+    with storage.open(visitor.photo_path) as photo_file:
+        return _counted(compose_badge(visitor.first_name, visitor.last_name, visitor.purpose,
+                                      visitor.finding, photo_file, visitor.visit_date))
+
+
+def _render_in_worker(first_name, last_name, purpose, finding, photo_bytes, keep_badge):
+    return render_registration(first_name, last_name, purpose, finding,
+                               io.BytesIO(photo_bytes), keep_badge)
+
+
+def _warm_worker():
+    """Pool initializer: load the badge assets and touch the PDF code once."""
+    assets.font(NAME_FONT_SIZE)
+    assets.font(INFO_FONT_SIZE)
+    badge = compose_badge("", "", "", "", Image.new("RGB", (1, 1)))
+    badge.write_pdf(io.BytesIO())
+
+
+def _ping():
+    return True
+
+
+class RenderPool:
+    """
+    Process pool for render_registration() with a bounded number of
+    registrations in flight (running or waiting for a worker).
+    """
+
+    def __init__(self, workers, queue_depth, timeout=30):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._lock = threading.Lock()
+        self._executor = self._start()
+
+    def _start(self):
+        executor = ProcessPoolExecutor(self.workers, initializer=_warm_worker)
+        # Start the workers now rather than on the first registration
+        for future in [executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def submit(self, first_name, last_name, purpose, finding, photo_bytes, keep_badge=False):
+        """
+        Start render_registration() in a worker without waiting for it.
+        Returns (executor, future); raises RenderPoolBusy when full.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise RenderPoolBusy()
+        executor = self._executor
+        try:
+            future = executor.submit(_render_in_worker, first_name, last_name, purpose,
+                                     finding, photo_bytes, keep_badge)
+        except BrokenProcessPool:
+            self._slots.release()
+            self.restart(executor)
+            raise RenderPoolBusy()
+        future.add_done_callback(lambda f: self._slots.release())
+        return executor, future
+
+    def render(self, first_name, last_name, purpose, finding, photo_bytes, keep_badge=False):
+        """render_registration() in a worker; raises RenderPoolBusy when full."""
+        executor, future = self.submit(first_name, last_name, purpose, finding, photo_bytes, keep_badge)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise RenderPoolBusy()
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory); replace the whole pool
+            self.restart(executor)
+            raise RenderPoolBusy()
+
+    def restart(self, broken):
+        """Replace the pool if 'broken' (a worker died in it) is still the current one."""
+        with self._lock:
+            if self._executor is broken:
+                log("render_pool_restart", logging.WARNING)
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._start()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,318 @@
+"""
+Data retention: old visits lose their photos and PDFs, and later the rows
+themselves, so storage and the visitor table stop growing.
+
+Two policies, both off unless configured (see config.py):
+
+  RETENTION_ARCHIVE_DAYS  photos of older visits are moved into zip archives
+                          in storage ("archive" namespace) and eagerly
+                          written badge PDFs are deleted. The row keeps the
+                          archive entry in photo_archive; badges and PDFs
+                          rendered from it afterwards have no photo.
+  RETENTION_PURGE_DAYS    older visits are deleted with their print jobs,
+                          the registrations they checked in with and
+                          archived photos, and so are guest list
+                          registrations whose expected day (import day
+                          without one) is older, with their pre-rendered
+                          badges. A list imported long before its event
+                          stays until the guests have come.
+
+Photos and badges are also rendered into the thumbnail, badge PDF and
+label caches; those renders go with the photo or the visit.
+
+A photo is shared by every visit of a returning visitor, so it is only
+archived or deleted once the newest visit using it is past the cutoff.
+
+The job works RETENTION_BATCH_SIZE rows at a time: files are read and
+written outside of any transaction, each batch's rows are changed in one
+short transaction, and files are deleted only after it commits (a crash in
+between leaves a stray file, never a row pointing at a missing one). It
+pauses between batches so kiosk writes get the database lock in between.
+dry_run() reports what a run would do without changing anything.
+"""
+import io
+import logging
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+
+import thumbnails
+
+from . import labels, pdfs
+from .extensions import db, get_label_cache, get_pdf_cache, get_storage, get_thumbnail_cache
+from .metrics import log, retention_actions
+from .models import PrintJob, Registration, Visitor
+
+RETENTION_BATCH_SIZE = 100
+RETENTION_BATCH_PAUSE = 0.2  # seconds between batches
+
+_retention_thread = None
+
+
+class RetentionPolicy:
+    """Cutoffs for one run; a policy set to 0 days is off."""
+
+    def __init__(self, archive_days=0, purge_days=0, now=None):
+        now = now or datetime.utcnow()
+        self.archive_before = now - timedelta(days=archive_days) if archive_days > 0 else None
+        self.purge_before = now - timedelta(days=purge_days) if purge_days > 0 else None
+
+    @classmethod
+    def from_config(cls, config, now=None):
+        return cls(config["RETENTION_ARCHIVE_DAYS"], config["RETENTION_PURGE_DAYS"], now)
+
+    @property
+    def enabled(self):
+        return self.archive_before is not None or self.purge_before is not None
+
+    def to_dict(self):
+        return {
+            "archive_before": self.archive_before.isoformat() if self.archive_before else None,
+            "purge_before": self.purge_before.isoformat() if self.purge_before else None,
+        }
+
+
+def archive_key(archive, member):
+    """photo_archive value for a photo stored as 'member' in the zip 'archive'."""
+    return f"{archive}/{member}"
+
+
+def split_archive_key(photo_archive):
+    """(zip key, member name) of a photo_archive value."""
+    parts = photo_archive.split("/")
+    # Zip keys are archive/xx/yy/<digest>.zip
+    return "/".join(parts[:4]), "/".join(parts[4:])
+
+
+def _expired_keys(column, cutoff, after, limit):
+    """
+    Keys in 'column' (oldest visits first, after the keyset position 'after')
+    whose newest visit is before cutoff. Returns (keys, next position).
+    """
+    query = (db.session.query(Visitor.created_at, Visitor.id, column)
+             .filter(column.isnot(None), Visitor.created_at < cutoff)
+             .order_by(Visitor.created_at, Visitor.id))
+    if after is not None:
+        query = query.filter(db.tuple_(Visitor.created_at, Visitor.id) > after)
+    rows = query.limit(limit).all()
+    if not rows:
+        return [], None
+    keys = {row[2] for row in rows}
+    in_use = {key for (key,) in (db.session.query(column).distinct()
+                                 .filter(column.in_(keys), Visitor.created_at >= cutoff))}
+    return sorted(keys - in_use), (rows[-1][0], rows[-1][1])
+
+
+def _registration_expired(cutoff):
+    """
+    Registrations past the purge cutoff. Guest lists are imported ahead of
+    the event, so they go by the expected day (the import day without one):
+    a guest still to come is never purged.
+    """
+    return func.coalesce(Registration.expected_on, Registration.created_at) < cutoff.date()
+
+
+def _delete_photos(storage, keys):
+    """Delete stored photos, and their cached thumbnails first (their keys need the photo)."""
+    get_thumbnail_cache().discard([key for photo in keys for key in thumbnails.thumbnail_keys(storage, photo)])
+    for key in keys:
+        storage.delete(key)
+
+
+def _evict_renders(visitor_ids):
+    """Drop the cached badge PDFs and labels of deleted visits; they show the visitor's photo."""
+    ids = set(visitor_ids)
+    pdf_cache = get_pdf_cache()
+    pdf_cache.discard([key for key in pdf_cache.keys() if pdfs.badge_pdf_visitor_id(key) in ids])
+    label_cache = get_label_cache()
+    label_cache.discard([key for key in label_cache.keys() if labels.label_visitor_id(key) in ids])
+
+
+def _size(storage, key):
+    path = storage.local_path(key)
+    return os.path.getsize(path) if path else 0
+
+
+def _archive_photos(storage, keys):
+    """Zip the photos into one archive in storage; returns (zip key, stored keys)."""
+    data = io.BytesIO()
+    stored = []
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as archive:
+        for key in keys:
+            try:
+                with storage.open(key) as photo:
+                    content = photo.read()
+            except OSError:
+                log("retention_photo_missing", logging.WARNING, key=key)
+                continue
+            # JPEGs don't compress any further; older PNG photos do
+            compress = zipfile.ZIP_STORED if key.endswith((".jpg", ".jpeg")) else zipfile.ZIP_DEFLATED
+            archive.writestr(key, content, compress_type=compress)
+            stored.append(key)
+    if not stored:
+        return None, []
+    return storage.put("archive", data.getvalue(), ".zip"), stored
+
+
+def archive_photos_batch(policy, storage, after=None):
+    """
+    Archive the expired photos of one batch of visits, oldest first, from
+    keyset position 'after'. Returns (photos archived, next position); the
+    position is None once every expired visit has been looked at.
+    """
+    keys, after = _expired_keys(Visitor.photo_path, policy.archive_before, after, RETENTION_BATCH_SIZE)
+    if not keys:
+        return 0, after
+    zip_key, stored = _archive_photos(storage, keys)
+    for key in stored:
+        (Visitor.query.filter(Visitor.photo_path == key)
+         .update({"photo_path": None, "photo_archive": archive_key(zip_key, key)}, synchronize_session=False))
+    db.session.commit()
+    _delete_photos(storage, stored)
+    retention_actions.inc(len(stored), action="photo_archived")
+    return len(stored), after
+
+
+def drop_pdfs_batch(policy, storage, after=None):
+    """Like archive_photos_batch(), for the badge PDFs written at registration by older versions."""
+    keys, after = _expired_keys(Visitor.pdf_path, policy.archive_before, after, RETENTION_BATCH_SIZE)
+    if not keys:
+        return 0, after
+    Visitor.query.filter(Visitor.pdf_path.in_(keys)).update({"pdf_path": None}, synchronize_session=False)
+    db.session.commit()
+    for key in keys:
+        storage.delete(key)
+    retention_actions.inc(len(keys), action="pdf_deleted")
+    return len(keys), after
+
+
+def purge_batch(policy, storage):
+    """Delete one batch of expired visits and registrations; returns how many rows went."""
+    visitors = (db.session.query(Visitor.id, Visitor.photo_path, Visitor.pdf_path, Visitor.photo_archive)
+                .filter(Visitor.created_at < policy.purge_before)
+                .order_by(Visitor.created_at, Visitor.id)
+                .limit(RETENTION_BATCH_SIZE).all())
+    ids = [row.id for row in visitors]
+    registrations = (db.session.query(Registration.id, Registration.badge_path)
+                     .filter(_registration_expired(policy.purge_before))
+                     .order_by(Registration.id)
+                     .limit(RETENTION_BATCH_SIZE).all())
+    if ids:
+        # The registrations these visits checked in with go too: unlinked,
+        # they would look like guests still to come and could check in again
+        registrations += (db.session.query(Registration.id, Registration.badge_path)
+                          .filter(Registration.visitor_id.in_(ids)).all())
+    badges = {row.id: row.badge_path for row in registrations}
+    if not visitors and not badges:
+        return 0
+
+    if badges:
+        Registration.query.filter(Registration.id.in_(badges)).delete(synchronize_session=False)
+    if ids:
+        PrintJob.query.filter(PrintJob.visitor_id.in_(ids)).delete(synchronize_session=False)
+        Visitor.query.filter(Visitor.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+    _evict_renders(ids)
+
+    # Files no remaining row refers to
+    files = {row.pdf_path for row in visitors if row.pdf_path}
+    files |= {path for path in badges.values() if path}
+    photos = {row.photo_path for row in visitors if row.photo_path}
+    if photos:
+        photos -= {key for (key,) in db.session.query(Visitor.photo_path).filter(Visitor.photo_path.in_(photos))}
+    archives = {split_archive_key(row.photo_archive)[0] for row in visitors if row.photo_archive}
+    for archive in list(archives):
+        if Visitor.query.filter(Visitor.photo_archive.startswith(archive + "/")).first() is not None:
+            archives.discard(archive)
+    _delete_photos(storage, photos)
+    for key in files | archives:
+        storage.delete(key)
+    retention_actions.inc(len(ids), action="visitor_deleted")
+    retention_actions.inc(len(badges), action="registration_deleted")
+    return len(ids) + len(badges)
+
+
+def apply_retention(policy, stop_event=None):
+    """Run the policy to completion (or until stop_event is set); returns what it did."""
+    storage = get_storage()
+    totals = {"rows_deleted": 0, "photos_archived": 0, "pdfs_deleted": 0}
+
+    def stopped():
+        return stop_event is not None and stop_event.is_set()
+
+    if policy.purge_before is not None:
+        while not stopped():
+            purged = purge_batch(policy, storage)
+            if not purged:
+                break
+            totals["rows_deleted"] += purged
+            time.sleep(RETENTION_BATCH_PAUSE)
+
+    if policy.archive_before is not None:
+        for step, total in ((archive_photos_batch, "photos_archived"), (drop_pdfs_batch, "pdfs_deleted")):
+            after = None
+            while not stopped():
+                done, after = step(policy, storage, after)
+                totals[total] += done
+                if after is None:
+                    break
+                time.sleep(RETENTION_BATCH_PAUSE)
+    return totals
+
+
+def dry_run(policy):
+    """What apply_retention() would archive, delete and free, without doing it."""
+    storage = get_storage()
+    report = {"policy": policy.to_dict(), "photos_to_archive": 0, "photo_bytes": 0, "pdfs_to_delete": 0,
+              "pdf_bytes": 0, "visitors_to_delete": 0, "registrations_to_delete": 0}
+    if policy.archive_before is not None:
+        for column, count, size in ((Visitor.photo_path, "photos_to_archive", "photo_bytes"),
+                                    (Visitor.pdf_path, "pdfs_to_delete", "pdf_bytes")):
+            newest = func.max(Visitor.created_at)
+            expired = (db.session.query(column).filter(column.isnot(None))
+                       .group_by(column).having(newest < policy.archive_before))
+            if policy.purge_before is not None:
+                expired = expired.having(newest >= policy.purge_before)  # deleted rather than archived
+            for (key,) in expired.yield_per(1000):
+                report[count] += 1
+                report[size] += _size(storage, key)
+    if policy.purge_before is not None:
+        expired_visitors = db.session.query(Visitor.id).filter(Visitor.created_at < policy.purge_before)
+        report["visitors_to_delete"] = expired_visitors.count()
+        report["registrations_to_delete"] = (Registration.query
+                                             .filter(or_(_registration_expired(policy.purge_before),
+                                                         Registration.visitor_id.in_(expired_visitors)))
+                                             .count())
+    return report
+
+
+def run_retention_worker(app, stop_event=None):
+    """Apply the configured policies every RETENTION_INTERVAL seconds until stop_event is set."""
+    stop_event = stop_event or threading.Event()
+    with app.app_context():
+        while not stop_event.is_set():
+            policy = RetentionPolicy.from_config(app.config)
+            try:
+                totals = apply_retention(policy, stop_event)
+                log("retention_run", **totals)
+            except Exception as e:
+                log("retention_failed", logging.ERROR, error=e)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+            stop_event.wait(app.config["RETENTION_INTERVAL"])
+
+
+def start_retention_worker(app):
+    """Run the retention job in a background thread, if a policy is configured."""
+    global _retention_thread
+    if not RetentionPolicy.from_config(app.config).enabled:
+        return None
+    _retention_thread = threading.Thread(target=run_retention_worker, args=(app,),
+                                         name="retention", daemon=True)
+    _retention_thread.start()
+    return _retention_thread
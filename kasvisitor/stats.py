@@ -0,0 +1,143 @@
+"""
+Visitor statistics: visit counts per hour and per day, in total, by purpose
+and by host (finding), kept in the visit_rollup table so /api/stats reads a
+bounded number of rows however many visits there are.
+
+Every visit the kiosk records adds 1 to its six rollup rows (hour and day,
+times total, purpose and host) in the same transaction as the visit, with
+an upsert, so concurrent kiosks never lose a count. Hours are UTC, like
+created_at; days are local dates, like the date on the badges.
+
+rebuild_rollups() recounts them from the visitor table: upgrade_schema()
+does that once for an existing database, and `flask backfill-stats` does it
+on demand. Visits deleted by the retention purge are still counted in the
+rollups but can't be recounted, so by default a rebuild keeps the days up
+to the purge cutoff as they are.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .extensions import db
+from .models import Visitor, VisitRollup
+
+STATS_PERIODS = ("hour", "day")
+STATS_DIMENSIONS = ("total", "purpose", "finding")
+REBUILD_BATCH_SIZE = 5000
+
+
+def local_midnight(created_at):
+    """Local midnight (naive) of the day of a naive UTC time."""
+    local = created_at.replace(tzinfo=timezone.utc).astimezone()
+    return datetime.combine(local.date(), time())
+
+
+def utc_time(local):
+    """A naive local time as naive UTC."""
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def rollup_keys(created_at, purpose, finding, days=True):
+    """The (period, dimension, start, value) rows a visit counts in."""
+    starts = [("hour", created_at.replace(minute=0, second=0, microsecond=0))]
+    if days:
+        starts.append(("day", local_midnight(created_at)))
+    for period, start in starts:
+        yield period, "total", start, ""
+        yield period, "purpose", start, purpose[:100]
+        yield period, "finding", start, finding[:100]
+
+
+def add_visits(counts):
+    """
+    Add counts ({(period, dimension, start, value): visits}) to the rollups,
+    in the current transaction.
+    """
+    if not counts:
+        return
+    rows = [{"period": period, "dimension": dimension, "start": start, "value": value, "visits": visits}
+            for (period, dimension, start, value), visits in counts.items()]
+    dialect = db.engine.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = (sqlite if dialect == "sqlite" else postgresql).insert(VisitRollup)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=["period", "dimension", "start", "value"],
+            set_={"visits": VisitRollup.visits + insert.excluded.visits}), rows)
+        return
+    for row in rows:
+        updated = (VisitRollup.query
+                   .filter_by(period=row["period"], dimension=row["dimension"], start=row["start"],
+                              value=row["value"])
+                   .update({"visits": VisitRollup.visits + row["visits"]}, synchronize_session=False))
+        if not updated:
+            db.session.execute(VisitRollup.__table__.insert(), row)
+
+
+def record_visit(visitor):
+    """Count a new visit; call before the commit that inserts it."""
+    if visitor.created_at is None:
+        visitor.created_at = datetime.utcnow()
+    add_visits(Counter(rollup_keys(visitor.created_at, visitor.purpose, visitor.finding)))
+
+
+def _count_visits(counts, query, day_cutoff):
+    for created_at, purpose, finding in query.yield_per(REBUILD_BATCH_SIZE):
+        days = day_cutoff is None or created_at >= day_cutoff
+        counts.update(rollup_keys(created_at, purpose, finding, days))
+
+
+def rebuild_rollups(since=None):
+    """
+    Recount the rollups of local date 'since' on (every day if None) from
+    the visitor table; earlier rollups are kept. Safe while kiosks record
+    visits. Returns the number of visits counted.
+    """
+    visits = db.session.query(Visitor.created_at, Visitor.purpose, Visitor.finding)
+    hours = VisitRollup.query.filter(VisitRollup.period == "hour")
+    days = VisitRollup.query.filter(VisitRollup.period == "day")
+    day_cutoff = None
+    if since is not None:
+        day_cutoff = utc_time(datetime.combine(since, time()))
+        hour_cutoff = day_cutoff.replace(minute=0, second=0, microsecond=0)
+        visits = visits.filter(Visitor.created_at >= hour_cutoff)
+        hours = hours.filter(VisitRollup.start >= hour_cutoff)
+        days = days.filter(VisitRollup.start >= datetime.combine(since, time()))
+
+    # Count what is there now without holding a transaction open, then
+    # replace the rollups and add the visits recorded in the meantime in one
+    last_id = db.session.query(db.func.max(Visitor.id)).scalar() or 0
+    counts = Counter()
+    _count_visits(counts, visits.filter(Visitor.id <= last_id), day_cutoff)
+    db.session.rollback()
+    hours.delete(synchronize_session=False)
+    days.delete(synchronize_session=False)
+    _count_visits(counts, visits.filter(Visitor.id > last_id), day_cutoff)
+    add_visits(counts)
+    db.session.commit()
+    return sum(n for (period, dimension, _, _), n in counts.items() if period == "hour" and dimension == "total")
+
+
+def rebuild_start(policy):
+    """
+    The first day a rebuild can recount under a retention policy: the day
+    after the purge cutoff, or None (every day) without a purge.
+    """
+    if policy.purge_before is None:
+        return None
+    return local_midnight(policy.purge_before).date() + timedelta(days=1)
+
+
+def backfill_rollups():
+    """Count the existing visits if the rollups are empty (a database from before them)."""
+    if VisitRollup.query.first() is None and Visitor.query.first() is not None:
+        rebuild_rollups()
+
+
+def query_rollups(period, dimension, start, end):
+    """Rollup rows of one period and dimension with start in [start, end), oldest first."""
+    return (VisitRollup.query
+            .filter(VisitRollup.period == period, VisitRollup.dimension == dimension,
+                    VisitRollup.start >= start, VisitRollup.start < end)
+            .order_by(VisitRollup.start, VisitRollup.value)
+            .all())
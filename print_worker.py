@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+"""
+Standalone label print worker.
+
+Run this once next to the kiosk service when it is served by gunicorn
+(`python print_worker.py`), so a single process owns the QL-800.
+"""
+from kasvisitor import create_app
+from kasvisitor.printing import run_print_worker
+
+if __name__ == '__main__':
+    run_print_worker(create_app(role="kiosk", render_pool=False))
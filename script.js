@@ -13,11 +13,103 @@ function showStep(step) {
   }
 }
 
+// Each registration is sent with an Idempotency-Key. A key is kept until the
+// server answers, so tapping again after a network error retries the same
+// registration instead of recording (and printing) the visitor twice.
+function newIdempotencyKey() {
+  if (window.crypto && crypto.randomUUID) {
+    return crypto.randomUUID();
+  }
+  return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
 // --- Step 1: Sign In ---
 document.getElementById('btn-signin').addEventListener('click', () => {
   showStep(2);
 });
 
+// --- Returning visitor: look up by phone, then check in with one tap ---
+let returningVisitor = null;
+let checkInKey = null;
+
+document.getElementById('btn-returning').addEventListener('click', () => {
+  showStep('returning');
+});
+
+document.getElementById('btn-returning-find').addEventListener('click', () => {
+  const phone = document.getElementById('returning-phone').value.trim();
+  if (!isValidPhone(phone)) {
+    alert('Please enter a valid 10-digit phone number.');
+    return;
+  }
+  fetch('/api/returning-visitors?phone=' + encodeURIComponent(phone))
+    .then(response => {
+      if (response.status === 404) {
+        // Not found: sign in as a new visitor with the phone already filled in
+        alert("We couldn't find your previous visit. Please sign in.");
+        document.getElementById('phone').value = phone;
+        showStep(2);
+        return null;
+      }
+      return response.json();
+    })
+    .then(visitor => {
+      if (!visitor) {
+        return;
+      }
+      returningVisitor = { ...visitor, phone };
+      checkInKey = null;
+      document.getElementById('returning-name').innerText = visitor.name;
+      document.getElementById('returning-purpose').value = visitor.purpose;
+      document.getElementById('returning-finding').value = '';
+      document.getElementById('returning-details').style.display = 'block';
+    })
+    .catch(error => {
+      console.error('Error:', error);
+      alert('Something went wrong!');
+    });
+});
+
+document.getElementById('btn-returning-not-me').addEventListener('click', () => {
+  returningVisitor = null;
+  showStep(2);
+});
+
+document.getElementById('btn-returning-checkin').addEventListener('click', () => {
+  const purpose = document.getElementById('returning-purpose').value;
+  const finding = document.getElementById('returning-finding').value.trim();
+  if (!purpose || !finding) {
+    alert('Please complete all fields.');
+    return;
+  }
+  if (!document.getElementById('returning-agree').checked) {
+    alert('You must agree to the Visitor Agreement & Confidentiality Form to continue.');
+    return;
+  }
+  checkInKey = checkInKey || newIdempotencyKey();
+  fetch('/submit', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Idempotency-Key': checkInKey },
+    body: JSON.stringify({
+      returningVisitorId: returningVisitor.visitorId, phone: returningVisitor.phone, purpose, finding
+    })
+  })
+  .then(response => response.json())
+  .then(result => {
+    if (result.success) {
+      alert('Welcome back to KAS!');
+      window.location.reload();
+    } else {
+      checkInKey = null;
+      alert('Error: ' + result.error);
+    }
+  })
+  .catch(error => {
+    console.error('Error:', error);
+    alert('Something went wrong!');
+  });
+});
+
 // --- Step 2: Name Entry ---
 document.getElementById('btn-name-next').addEventListener('click', () => {
   const firstName = document.getElementById('first-name').value.trim();
@@ -136,6 +228,8 @@ btnPhotoNext.addEventListener('click', () => {
 });
 
 // --- Step 6: Welcome & Data Submission ---
+let registrationKey = null;
+
 document.getElementById('btn-finish').addEventListener('click', () => {
   // Gather data from all steps
   const visitorData = {
@@ -145,28 +239,35 @@ document.getElementById('btn-finish').addEventListener('click', () => {
     phone: document.getElementById('phone').value.trim(),
     purpose: document.getElementById('purpose').value,
     finding: document.getElementById('finding').value.trim(),
-    // Use the captured photo data URL as the photo
-    photo: capturedPhoto.src,
     agreed: document.getElementById('agree-checkbox').checked
   };
 
-  // Send data to backend API (update URL as necessary)
-  fetch('/submit', {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(visitorData)
-  })
-  .then(response => response.json())
-  .then(result => {
-    if (result.success) {
-      alert('Welcome to KAS!');
-      window.location.reload();
-    } else {
-      alert('Error: ' + result.error);
-    }
-  })
-  .catch(error => {
-    console.error('Error:', error);
-    alert('Something went wrong!');
-  });
+  // Send the captured frame as a binary JPEG part rather than a base64 data URL
+  photoCanvas.toBlob((photoBlob) => {
+    const formData = new FormData();
+    Object.entries(visitorData).forEach(([key, value]) => formData.append(key, value));
+    formData.append('photo', photoBlob, 'photo.jpg');
+
+    // Send data to backend API (update URL as necessary)
+    registrationKey = registrationKey || newIdempotencyKey();
+    fetch('/submit', {
+      method: 'POST',
+      headers: { 'Idempotency-Key': registrationKey },
+      body: formData
+    })
+    .then(response => response.json())
+    .then(result => {
+      if (result.success) {
+        alert('Welcome to KAS!');
+        window.location.reload();
+      } else {
+        registrationKey = null;
+        alert('Error: ' + result.error);
+      }
+    })
+    .catch(error => {
+      console.error('Error:', error);
+      alert('Something went wrong!');
+    });
+  }, 'image/jpeg', 0.9);
 });
@@ -0,0 +1,204 @@
+"""
+Storage for visitor photos and badge PDFs.
+
+Files are content-addressed: a file's key is the SHA-256 of its bytes,
+sharded into two levels of subdirectories, e.g.
+
+    photos/3f/a9/3fa9...e1.jpg
+
+so identical uploads are stored once and no directory grows to hundreds of
+thousands of entries. Keys are what the Visitor rows store in photo_path and
+pdf_path. Rows written before this layout hold flat keys such as
+"photos/visitor_0912345678_1743060826.png", which every backend still reads.
+
+Backends share the Storage interface: LocalStorage keeps files under a
+directory, S3Storage keeps them in an S3-compatible bucket (needs boto3).
+Pick one with STORAGE_BACKEND=local|s3 (see storage_from_env).
+"""
+import hashlib
+import io
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+from werkzeug.utils import safe_join
+
+
+def content_key(namespace, data, extension):
+    """Sharded, content-addressed key for data under namespace."""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{namespace}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+class Storage(ABC):
+    """
+    Interface of the storage backends. Keys are '/'-separated relative paths.
+    """
+
+    @abstractmethod
+    def put(self, namespace, data, extension):
+        """Store bytes and return their key. Storing the same bytes twice is a no-op."""
+
+    @abstractmethod
+    def exists(self, key):
+        """Whether key is stored."""
+
+    @abstractmethod
+    def open(self, key):
+        """Readable binary file object for key; raises FileNotFoundError."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove key if it exists."""
+
+    def modified_time(self, key):
+        """Last modification as a POSIX timestamp, or None if unknown."""
+        return None
+
+    def local_path(self, key):
+        """Filesystem path for key if the backend has one, else None."""
+        return None
+
+    def url(self, key, expires_in=300):
+        """Time-limited URL clients can fetch key from directly, or None."""
+        return None
+
+
+class LocalStorage(Storage):
+    """
+    Files under a root directory, written to a temporary file and renamed
+    into place so readers never see a partial file.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        path = safe_join(self.root, key)
+        if path is None:
+            raise FileNotFoundError(key)
+        return path
+
+    def put(self, namespace, data, extension):
+        key = content_key(namespace, data, extension)
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return key
+
+    def exists(self, key):
+        try:
+            return os.path.isfile(self._path(key))
+        except FileNotFoundError:
+            return False
+
+    def open(self, key):
+        return open(self._path(key), "rb")
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def modified_time(self, key):
+        try:
+            return os.path.getmtime(self._path(key))
+        except OSError:
+            return None
+
+    def local_path(self, key):
+        try:
+            path = self._path(key)
+        except FileNotFoundError:
+            return None
+        return path if os.path.isfile(path) else None
+
+
+class S3Storage(Storage):
+    """
+    Objects in an S3-compatible bucket (AWS, MinIO, ...), optionally under a
+    key prefix. 'client' is a boto3 S3 client; one is created if omitted.
+    """
+
+    def __init__(self, bucket, prefix="", client=None, **client_kwargs):
+        if client is None:
+            import boto3
+            client = boto3.client("s3", **client_kwargs)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def put(self, namespace, data, extension):
+        key = content_key(namespace, data, extension)
+        if self._head(key) is None:
+            self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+        return key
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def open(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(key)
+            raise
+        return io.BytesIO(obj["Body"].read())
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def modified_time(self, key):
+        head = self._head(key)
+        return head["LastModified"].timestamp() if head else None
+
+    def url(self, key, expires_in=300):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=expires_in)
+
+
+def storage_from_env():
+    """
+    Backend chosen by environment variables:
+      STORAGE_BACKEND      local (default) or s3
+      STORAGE_ROOT         local: base directory (default: current directory)
+      STORAGE_S3_BUCKET    s3: bucket name
+      STORAGE_S3_PREFIX    s3: optional key prefix
+      STORAGE_S3_ENDPOINT  s3: endpoint URL for S3-compatible services
+    """
+    backend = os.environ.get("STORAGE_BACKEND", "local")
+    if backend == "s3":
+        kwargs = {}
+        if os.environ.get("STORAGE_S3_ENDPOINT"):
+            kwargs["endpoint_url"] = os.environ["STORAGE_S3_ENDPOINT"]
+        return S3Storage(os.environ["STORAGE_S3_BUCKET"], os.environ.get("STORAGE_S3_PREFIX", ""), **kwargs)
+    if backend == "local":
+        return LocalStorage(os.environ.get("STORAGE_ROOT", "."))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,138 @@
+"""
+The retention purge deletes personal data for good: check it removes the
+expired visits and registrations, their files and their cached renders,
+and nothing else.
+"""
+import io
+from datetime import date, datetime, timedelta
+
+import pytest
+from PIL import Image
+
+import thumbnails
+from kasvisitor import PrintJob, Registration, Visitor, create_app, db, labels, pdfs, retention
+from kasvisitor.extensions import get_label_cache, get_pdf_cache, get_storage, get_thumbnail_cache
+
+PURGE_DAYS = 30
+
+
+def jpeg(color):
+    data = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(data, "JPEG")
+    return data.getvalue()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("STORAGE_ROOT", str(tmp_path / "storage"))
+    monkeypatch.setattr(retention, "RETENTION_BATCH_SIZE", 2)  # several batches
+    monkeypatch.setattr(retention, "RETENTION_BATCH_PAUSE", 0)
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'kiosk.db'}", "REQUEST_LOG": False,
+                      "THUMBNAIL_CACHE_DIR": str(tmp_path / "thumbnails"), "PDF_CACHE_DIR": str(tmp_path / "pdfs"),
+                      "LABEL_CACHE_DIR": str(tmp_path / "labels")})
+    with app.app_context():
+        yield app
+
+
+def add_visitor(name, days_ago, photo=None):
+    visitor = Visitor(first_name=name, last_name="Test", email=f"{name}@example.com", phone=name,
+                      purpose="Meeting", finding="Office", photo_path=photo,
+                      created_at=datetime.utcnow() - timedelta(days=days_ago))
+    db.session.add(visitor)
+    db.session.add(PrintJob(visitor=visitor))
+    db.session.flush()
+    return visitor
+
+
+def add_registration(name, expected_in, imported_days_ago, visitor=None):
+    storage = get_storage()
+    registration = Registration(first_name=name, last_name="Guest",
+                                expected_on=date.today() + timedelta(days=expected_in),
+                                created_at=datetime.utcnow() - timedelta(days=imported_days_ago),
+                                badge_path=storage.put("badges", name.encode(), ".png"),
+                                visitor_id=visitor.id if visitor else None)
+    db.session.add(registration)
+    return registration
+
+
+def cache_renders(visitor):
+    """Put a badge PDF, a label and thumbnails for the visitor in the caches."""
+    get_pdf_cache().put(visitor.pdf_key.split("/", 1)[1], b"%PDF")
+    get_label_cache().put(labels.label_key(visitor), b"raster")
+    if visitor.photo_path:
+        for key in thumbnails.thumbnail_keys(get_storage(), visitor.photo_path):
+            get_thumbnail_cache().put(key, b"thumb")
+
+
+def test_purge_removes_exactly_the_expired_rows_files_and_renders(app):
+    storage = get_storage()
+    own_photo = storage.put("photos", jpeg("red"), ".jpg")
+    shared_photo = storage.put("photos", jpeg("blue"), ".jpg")
+
+    old = add_visitor("old", 40, own_photo)
+    old_returning = add_visitor("old_returning", 45, shared_photo)
+    old_checked_in = add_visitor("old_checked_in", 35)
+    recent = add_visitor("recent", 2, shared_photo)
+    recent_checked_in = add_visitor("recent_checked_in", 1)
+
+    add_registration("past_guest", -40, 50)
+    add_registration("future_guest", 5, 40)          # imported long before the event
+    add_registration("checked_in_old", -35, 40, old_checked_in)
+    add_registration("checked_in_recent", -1, 40, recent_checked_in)
+    add_registration("today_guest", 0, 60)
+    db.session.commit()
+    visitors = (old, old_returning, old_checked_in, recent, recent_checked_in)
+    for visitor in visitors:
+        cache_renders(visitor)
+    kept_renders = {cache: set(cache.keys()) for cache in (get_pdf_cache(), get_label_cache())}
+    shared_thumbnails = set(thumbnails.thumbnail_keys(storage, shared_photo))
+    old_thumbnails = set(thumbnails.thumbnail_keys(storage, own_photo))
+    badges = {r.first_name: r.badge_path for r in Registration.query}
+    ids = {v.first_name: v.id for v in visitors}
+
+    policy = retention.RetentionPolicy(purge_days=PURGE_DAYS)
+    report = retention.dry_run(policy)
+    totals = retention.apply_retention(policy)
+
+    assert report["visitors_to_delete"] == 3
+    assert report["registrations_to_delete"] == 2
+    assert totals["rows_deleted"] == 5
+
+    assert {v.first_name for v in Visitor.query} == {"recent", "recent_checked_in"}
+    assert {job.visitor_id for job in PrintJob.query} == {ids["recent"], ids["recent_checked_in"]}
+    remaining = {r.first_name: r.visitor_id for r in Registration.query}
+    assert remaining == {"future_guest": None, "checked_in_recent": ids["recent_checked_in"], "today_guest": None}
+
+    assert not storage.exists(own_photo)
+    assert storage.exists(shared_photo)
+    for name, path in badges.items():
+        assert storage.exists(path) == (name in remaining)
+
+    purged = {ids["old"], ids["old_returning"], ids["old_checked_in"]}
+    assert {pdfs.badge_pdf_visitor_id(key) for key in get_pdf_cache().keys()} == {ids["recent"], ids["recent_checked_in"]}
+    assert {labels.label_visitor_id(key) for key in get_label_cache().keys()} == {ids["recent"], ids["recent_checked_in"]}
+    for cache in kept_renders:
+        assert set(cache.keys()) <= kept_renders[cache]
+    assert set(get_thumbnail_cache().keys()) == shared_thumbnails
+    assert not old_thumbnails & set(get_thumbnail_cache().keys())
+    assert not purged & {labels.label_visitor_id(key) for key in get_label_cache().keys()}
+
+    # Nothing left to do
+    assert retention.apply_retention(policy)["rows_deleted"] == 0
+
+
+def test_purged_registration_cannot_check_in_again(app):
+    visitor = add_visitor("guest", 40)
+    registration = add_registration("guest", -40, 45, visitor)
+    db.session.commit()
+    registration_id = registration.id
+
+    retention.apply_retention(retention.RetentionPolicy(purge_days=PURGE_DAYS))
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+    response = client.post(f"/api/registrations/{registration_id}/check-in")
+    assert response.status_code == 404
+    assert Visitor.query.count() == 0
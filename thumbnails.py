@@ -0,0 +1,65 @@
+"""
+Small, cached versions of visitor photos for the admin panel.
+
+Thumbnails are made on first request at a few fixed sizes, as WebP when
+the browser accepts it and JPEG otherwise, and kept in a size-bounded disk
+cache (the app's, in THUMBNAIL_CACHE_DIR). The cache key includes the
+photo's storage key and modification time, so a replaced photo gets new
+thumbnails.
+"""
+import hashlib
+import io
+import os
+
+from PIL import Image, features
+
+THUMBNAIL_SIZES = (64, 128, 256)   # longest side, in pixels
+THUMBNAIL_CACHE_BYTES = 200 * 1024 * 1024
+THUMBNAIL_QUALITY = 80
+
+WEBP_SUPPORTED = features.check("webp")
+
+
+def thumbnail_format(accept_header):
+    """('WEBP', 'image/webp') if the client takes WebP, else JPEG."""
+    if WEBP_SUPPORTED and "image/webp" in (accept_header or ""):
+        return "WEBP", "image/webp"
+    return "JPEG", "image/jpeg"
+
+
+def make_thumbnail(photo_file, size, image_format):
+    """Encoded thumbnail bytes with the longest side at most size pixels."""
+    with Image.open(photo_file) as photo:
+        photo.draft("RGB", (size, size))
+        thumb = photo.convert("RGB")
+    thumb.thumbnail((size, size), Image.LANCZOS)
+    out = io.BytesIO()
+    thumb.save(out, image_format, quality=THUMBNAIL_QUALITY)
+    return out.getvalue()
+
+
+def _digest(storage, photo_key):
+    return hashlib.sha1(f"{photo_key}:{storage.modified_time(photo_key)}".encode()).hexdigest()[:20]
+
+
+def thumbnail_keys(storage, photo_key):
+    """Cache keys of every thumbnail of a stored photo; call before the photo is deleted."""
+    digest = _digest(storage, photo_key)
+    return [os.path.join(str(size), f"{digest}.{extension}")
+            for size in THUMBNAIL_SIZES for extension in ("webp", "jpeg")]
+
+
+def get_thumbnail(cache, storage, photo_key, size, image_format):
+    """
+    Path of the thumbnail for a stored photo in 'cache' (a BoundedDiskCache),
+    creating it on a miss.
+    Also returns a validator string (stable across cache hits) for the ETag.
+    """
+    digest = _digest(storage, photo_key)
+    key = os.path.join(str(size), f"{digest}.{image_format.lower()}")
+
+    def create():
+        with storage.open(photo_key) as photo_file:
+            return make_thumbnail(photo_file, size, image_format)
+
+    return cache.get_or_create(key, create), f"{digest}-{size}-{image_format.lower()}"
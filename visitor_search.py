@@ -0,0 +1,101 @@
+"""
+Full-text search over visitor records for the admin panel.
+
+visitor_fts is an SQLite FTS5 table using the visitor table as external
+content. Triggers on visitor keep it in sync, so rows written by the kiosk
+app are searchable without the kiosk knowing about the index.
+"""
+import logging
+import re
+
+from sqlalchemy import Integer, column, exc, text
+
+logger = logging.getLogger("kasvisitor.search")
+
+FTS_TABLE = "visitor_fts"
+FTS_COLUMNS = ("first_name", "last_name", "email", "phone", "purpose", "finding")
+# bm25() weights, in FTS_COLUMNS order: names count most
+FTS_WEIGHTS = (10.0, 10.0, 4.0, 4.0, 1.0, 2.0)
+
+_cols = ", ".join(FTS_COLUMNS)
+_new = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+_old = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+
+SETUP_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_cols},
+        content='visitor', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS visitor_fts_ai AFTER INSERT ON visitor BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS visitor_fts_ad AFTER DELETE ON visitor BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS visitor_fts_au AFTER UPDATE ON visitor BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old});
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new});
+    END""",
+]
+
+
+def setup_search_index(engine):
+    """
+    Create the FTS table and its triggers if needed, and backfill it when it
+    is out of step with the visitor table (first run, or rows written while
+    the triggers didn't exist yet). Returns False if FTS5 isn't available.
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+    try:
+        with engine.begin() as conn:
+            for statement in SETUP_STATEMENTS:
+                conn.execute(text(statement))
+            indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}_docsize")).scalar()
+            total = conn.execute(text("SELECT count(*) FROM visitor")).scalar()
+            if indexed != total:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    except exc.OperationalError as e:
+        logger.warning("Full-text search disabled, FTS5 is not available: %s", e)
+        return False
+    return True
+
+
+def search_index_ready(engine):
+    """Whether the FTS table exists (set up by setup_search_index)."""
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE}).first() is not None
+
+
+def build_match_query(query):
+    """
+    Turn free text into an FTS5 query: every word must match the start of
+    a token in some column. Returns None if there is nothing to search for.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def matching_ids(match):
+    """Selectable of visitor ids matching an FTS5 query, for use in IN (...)."""
+    return (text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match")
+            .bindparams(match=match)
+            .columns(column("rowid", Integer)))
+
+
+def search_visitor_ids(session, match, limit):
+    """Best matching visitor ids for an FTS5 query, best first."""
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    rows = session.execute(
+        text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+             f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT :limit"),
+        {"match": match, "limit": limit},
+    )
+    return [row[0] for row in rows]